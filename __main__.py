@@ -1,5 +1,16 @@
+import argparse
+
 from core import Bot
 
-bot = Bot(command_prefix="yea ", max_messages=1)
+OPTIONS = {'command_prefix': "yea ", 'max_messages': 1}
+
 if __name__ == "__main__":
-    bot.run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cluster', nargs='?', type=int, const=0, metavar='CLUSTERS',
+                        help="run one process per shard range, cluster.clusters or one per core by default")
+    args = parser.parse_args()
+    if args.cluster is None:
+        Bot(**OPTIONS).run()
+    else:
+        from core.cluster import ClusterLauncher
+        ClusterLauncher(OPTIONS, args.cluster or None).run()
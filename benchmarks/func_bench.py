@@ -0,0 +1,156 @@
+"""Microbenchmarks for extensions/code/func.py on synthetic inventories.
+
+Measures parse throughput, finder (and SearchIndex) latency across query lengths
+and hit rates, and memory per entry. Results are written as JSON so runs on
+different commits can be compared, e.g.
+``python -m benchmarks.func_bench --output bench-$(git rev-parse --short HEAD).json``.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+import zlib
+
+from extensions.code.func import SphinxObjectFileReader, finder, parse_object_inv
+from extensions.code.index import SearchIndex
+
+from .parse_stream import URL, streamed
+from .synthetic import make_inventory
+
+QUERY_LENGTHS = (2, 4, 8, 16)
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parse(data: bytes, repeat: int) -> dict:
+    raw = len(zlib.decompress(data[data.index(b'zlib.\n') + 6:]))
+    results = {}
+    for name, func in (
+        ('parse_object_inv', lambda: parse_object_inv(SphinxObjectFileReader(data), URL)),
+        ('stream_parser', lambda: streamed(data))
+    ):
+        entries = len(func())
+        seconds = best_of(func, repeat)
+        results[name] = {
+            'seconds': seconds,
+            'compressed_mb_s': len(data) / seconds / 1e6,
+            'uncompressed_mb_s': raw / seconds / 1e6,
+            'entries_s': entries / seconds
+        }
+    return results
+
+
+def bench_memory(data: bytes) -> dict:
+    results = {}
+    for name, func in (
+        ('dict', lambda: parse_object_inv(SphinxObjectFileReader(data), URL)),
+        ('inventory', lambda: streamed(data))
+    ):
+        tracemalloc.start()
+        table = func()
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = retained / len(table)
+        del table
+    return results
+
+
+def make_queries(names: list, length: int, hit: bool, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        if hit:
+            # an ordered subsequence of a real name always matches
+            name = rng.choice([n for n in rng.sample(names, 20) if len(n) >= length] or names)
+            picked = sorted(rng.sample(range(len(name)), min(length, len(name))))
+            queries.append(''.join(name[i] for i in picked))
+        else:
+            queries.append(''.join(rng.choice('qxz0123456789') for _ in range(length)))
+    return queries
+
+
+def bench_search(table: dict, repeat: int, queries_per_case: int, rng: random.Random, include_finder: bool) -> list:
+    items = list(table.items())
+    names = list(table)
+    index = SearchIndex(names)
+    results = []
+    for length in QUERY_LENGTHS:
+        for hit in (True, False):
+            queries = make_queries(names, length, hit, queries_per_case, rng)
+            case = {'query_length': length, 'hit': hit}
+            case['hit_rate'] = statistics.mean(len(index.search(q)) for q in queries) / len(names)
+            case['search_index_ms'] = statistics.mean(
+                best_of(lambda: index.search(q, 8), repeat) for q in queries
+            ) * 1000
+            if include_finder:
+                case['finder_ms'] = statistics.mean(
+                    best_of(lambda: finder(q, items, key=lambda t: t[0])[:8], repeat) for q in queries
+                ) * 1000
+            results.append(case)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 500_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--queries', type=int, default=5, help="queries per (length, hit rate) case")
+    parser.add_argument('--finder-max-size', type=int, default=100_000,
+                        help="skip the linear finder above this many entries")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': []
+    }
+    for size in args.sizes:
+        data = make_inventory(size, seed=args.seed)
+        table = parse_object_inv(SphinxObjectFileReader(data), URL)
+        result = {
+            'entries': size,
+            'compressed_bytes': len(data),
+            'parse': bench_parse(data, args.repeat),
+            'bytes_per_entry': bench_memory(data),
+            'search': bench_search(table, args.repeat, args.queries, rng, size <= args.finder_max_size)
+        }
+        report['sizes'].append(result)
+
+        parse = result['parse']
+        print(f"{size:>7} entries: parse {parse['parse_object_inv']['entries_s']:,.0f}/s buffered, "
+              f"{parse['stream_parser']['entries_s']:,.0f}/s streamed; "
+              f"{result['bytes_per_entry']['dict']:.0f} B/entry dict, "
+              f"{result['bytes_per_entry']['inventory']:.0f} B/entry inventory")
+        for case in result['search']:
+            finder_ms = f"{case['finder_ms']:8.2f}ms" if 'finder_ms' in case else "    skipped"
+            print(f"    len {case['query_length']:>2} {'hit ' if case['hit'] else 'miss'} "
+                  f"(hit rate {case['hit_rate']:.4f}): finder {finder_ms}, index {case['search_index_ms']:8.2f}ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
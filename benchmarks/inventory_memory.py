@@ -0,0 +1,35 @@
+"""Compares the memory used by a parsed inventory as a dict and as an Inventory.
+
+Run with ``python -m benchmarks.inventory_memory`` from the repository root.
+"""
+import argparse
+
+from extensions.code.func import SphinxObjectFileReader, SphinxObjectStreamParser, parse_object_inv
+from extensions.code.index import dict_footprint
+
+from .synthetic import make_inventory
+
+URL = 'https://example.com/docs/en/latest'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 300_000])
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'dict MiB':>9} {'compact MiB':>12} {'B/entry':>8} {'ratio':>6}")
+    for size in args.sizes:
+        data = make_inventory(size)
+        table = parse_object_inv(SphinxObjectFileReader(data), URL)
+        stream = SphinxObjectStreamParser(URL)
+        stream.feed(data)
+        inventory = stream.close()
+        assert table == inventory
+
+        before, after = dict_footprint(table), inventory.footprint()
+        print(f"{size:>8} {before / 2 ** 20:>9.1f} {after / 2 ** 20:>12.1f} {after / len(inventory):>8.1f} "
+              f"{before / after:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Drives the cogs against local stand-in upstreams and reports latency, throughput and memory.
+
+Run with ``python -m benchmarks.loadtest`` from the repository root, for example
+``python -m benchmarks.loadtest --scenario rtfm run --concurrency 50 --requests 2000``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import psutil
+
+from extensions.code.rtfm import RTFM
+from extensions.code.run import ExecuteCode
+
+from .standins import FakeBot, FakeContext, StandInServer, StandInSession
+from .synthetic import WORDS
+
+SNIPPETS = (
+    ("py", "print('hello world')"),
+    ("py", "print(sum(range(100)))"),
+    ("py", "for i in range(3):\n    print(i)"),
+    ("js", "console.log([1, 2, 3].map(x => x * 2))"),
+    ("rs", "fn main() { println!(\"{}\", 1 + 1); }")
+)
+
+
+def make_query(rng: random.Random) -> str:
+    first, second = rng.sample(WORDS, 2)
+    return rng.choice((first, f"{first}.{second[:3]}", f"{first[:2]}{second[:2]}", f"{first}_{second}"))
+
+
+class Scenarios:
+    def __init__(self, bot: FakeBot, seed: int = 0) -> None:
+        self.bot = bot
+        self.rng = random.Random(seed)
+        self.rtfm = RTFM(bot)
+        self.execute = ExecuteCode(bot)
+        self.sphinx_docs = [key for key, doc in self.rtfm._valid_docs.items() if doc.method == 0]
+        self.scraped_docs = [key for key, doc in self.rtfm._valid_docs.items() if doc.method == 1]
+
+    def context(self) -> FakeContext:
+        return FakeContext(self.bot, guild_id=self.rng.randrange(20), user_id=self.rng.randrange(10 ** 6))
+
+    async def setup(self, warm: bool) -> None:
+        await self.execute.prep()
+        if warm:
+            await asyncio.gather(*map(self.rtfm.ensure_table, self.sphinx_docs))
+            await self.rtfm.webscrape.refresh_indexes()
+
+    def close(self) -> None:
+        self.rtfm.cog_unload()
+        self.execute.prep.cancel()
+
+    async def rtfm_command(self) -> None:
+        doc = self.rng.choice(self.sphinx_docs + self.scraped_docs)
+        await self.rtfm.rtfm.callback(self.rtfm, self.context(), doc.lower(), query=make_query(self.rng))
+
+    async def sphinx(self) -> None:
+        await self.rtfm.from_sphinx(self.context(), self.rng.choice(self.sphinx_docs), make_query(self.rng))
+
+    async def scrape(self) -> None:
+        doc = self.rng.choice(self.scraped_docs)
+        await self.rtfm.webscrape.do_other(self.context(), doc.lower(), self.rtfm.get_url(doc), make_query(self.rng))
+
+    async def run(self) -> None:
+        language, source = self.rng.choice(SNIPPETS)
+        await self.execute.run.callback(self.execute, self.context(), language, code=f"```{language}\n{source}```")
+
+    def get(self, name: str):
+        return {'rtfm': self.rtfm_command, 'sphinx': self.sphinx, 'scrape': self.scrape, 'run': self.run}[name]
+
+
+def percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def drive(operation, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                await operation()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': requests / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0
+    }
+
+
+async def sample_rss(peak: dict, interval: float = 0.05) -> None:
+    process = psutil.Process()
+    while True:
+        peak['rss'] = max(peak['rss'], process.memory_info().rss)
+        await asyncio.sleep(interval)
+
+
+async def main(args: argparse.Namespace) -> list:
+    server = StandInServer(latency=args.upstream_latency / 1000, inventory_size=args.inventory_size,
+                           execute_latency=args.execute_latency / 1000)
+    base = await server.start()
+    session = StandInSession(base)
+    bot = FakeBot(session, {
+        'run': {'concurrency': args.run_concurrency, 'cache': args.run_cache},
+        'webscrape': {}
+    })
+    scenarios = Scenarios(bot, args.seed)
+    peak = {'rss': 0}
+    sampler = asyncio.ensure_future(sample_rss(peak))
+    results = []
+    try:
+        await scenarios.setup(args.warm)
+        for name in args.scenario:
+            result = await drive(scenarios.get(name), args.requests, args.concurrency)
+            result.update(scenario=name, concurrency=args.concurrency, peak_rss_mib=peak['rss'] / 2 ** 20)
+            results.append(result)
+            print(f"{name:>7}: {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+                  f"p99 {result['p99_ms']:8.2f}ms  errors {result['errors']}  "
+                  f"peak RSS {result['peak_rss_mib']:.0f} MiB")
+    finally:
+        sampler.cancel()
+        scenarios.close()
+        await session.close()
+        await server.close()
+        bot.close()
+    return results
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', nargs='+', default=['rtfm', 'sphinx', 'scrape', 'run'],
+                        choices=('rtfm', 'sphinx', 'scrape', 'run'))
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--inventory-size', type=int, default=20_000)
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help="milliseconds added to every upstream call")
+    parser.add_argument('--execute-latency', type=float, default=50.0, help="milliseconds a stand-in Piston run takes")
+    parser.add_argument('--run-concurrency', type=int, default=4)
+    parser.add_argument('--run-cache', action='store_true')
+    parser.add_argument('--warm', action='store_true', help="load every index before measuring")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(main(args))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
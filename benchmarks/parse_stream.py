@@ -0,0 +1,60 @@
+"""Compares parse_object_inv against the streaming SphinxObjectStreamParser.
+
+Run with ``python -m benchmarks.parse_stream`` from the repository root.
+"""
+import argparse
+import time
+import tracemalloc
+
+from extensions.code.func import SphinxObjectFileReader, SphinxObjectStreamParser, parse_object_inv
+
+from .synthetic import make_inventory
+
+URL = 'https://example.com/docs'
+
+
+def buffered(data: bytes) -> dict:
+    return parse_object_inv(SphinxObjectFileReader(data), URL)
+
+
+def streamed(data: bytes, chunk_size: int = SphinxObjectFileReader.BUFSIZE) -> dict:
+    parser = SphinxObjectStreamParser(URL)
+    for pos in range(0, len(data), chunk_size):
+        parser.feed(data[pos:pos + chunk_size])
+    return parser.close()
+
+
+def measure(func, data: bytes, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 300_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'parser':>9} {'MB/s':>8} {'entries/s':>11} {'peak MiB':>9}")
+    for size in args.sizes:
+        data = make_inventory(size)
+        results = []
+        for name, func in (('buffered', buffered), ('streamed', streamed)):
+            seconds, peak, result = measure(func, data, args.repeat)
+            results.append(result)
+            print(f"{size:>8} {name:>9} {len(data) / seconds / 1e6:>8.2f} {len(result) / seconds:>11.0f} "
+                  f"{peak / 2 ** 20:>9.1f}")
+        assert results[0] == results[1], 'parsers disagree'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Local stand-ins for every upstream the bot talks to, plus a fake bot and context.
+
+One aiohttp server answers for all hosts. StandInSession rewrites
+``https://<host>/<path>`` to ``http://127.0.0.1:<port>/<host>/<path>``, so the
+cogs run unmodified against it.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from core import Bot, Context
+from core.http import HTTPClient
+
+from .synthetic import WORDS, make_inventory
+
+RUNTIMES = [
+    {"name": "python3", "aliases": ["py", "python", "py3"], "version": "3.9.4"},
+    {"name": "javascript", "aliases": ["js", "node"], "version": "15.10.0"},
+    {"name": "rust", "aliases": ["rs"], "version": "1.50.0"},
+    {"name": "cpp", "aliases": ["c++", "g++"], "version": "10.2.0"}
+]
+
+
+def make_rust_index(count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    names, types, paths, parents = ["std"], [0], [[0, ""]], [0]
+    structs = []
+    for i in range(1, count):
+        if structs and rng.random() < 0.6:
+            names.append(f"{rng.choice(WORDS)}_{rng.choice(WORDS)}")
+            types.append(11)  # method
+            parents.append(rng.randrange(len(structs)) + 1)
+        else:
+            name = f"{rng.choice(WORDS).title()}{rng.choice(WORDS).title()}"
+            names.append(name)
+            types.append(3)  # struct
+            parents.append(0)
+            structs.append([3, name])
+            paths.append([i, f"std::{rng.choice(WORDS)}"])
+    corpus = {"t": "".join(chr(65 + t) for t in types), "n": names, "q": paths, "i": parents, "p": structs}
+    payload = json.dumps([["std", corpus]]).replace("\\", "\\\\").replace("'", "\\'")
+    return f"var searchIndex = new Map(JSON.parse('{payload}'));"
+
+
+def make_discordjs_docs(count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    classes = []
+    for i in range(max(1, count // 20)):
+        classes.append({
+            "name": f"{rng.choice(WORDS).title()}{rng.choice(WORDS).title()}{i}",
+            "props": [{"name": f"{rng.choice(WORDS)}{j}"} for j in range(8)],
+            "methods": [{"name": f"{rng.choice(WORDS)}{j}", "scope": "static" if j == 0 else None} for j in range(8)],
+            "events": [{"name": f"{rng.choice(WORDS)}Create{j}"} for j in range(3)]
+        })
+    typedefs = [{"name": f"{rng.choice(WORDS).title()}Options{i}"} for i in range(count // 20)]
+    return json.dumps({"classes": classes, "typedefs": typedefs})
+
+
+def make_cppreference_index(count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = ["<index>"]
+    for i in range(count // 5):
+        name = f"std::{rng.choice(WORDS)}_{i}"
+        lines.append(f'<class name="{name}" link="cpp/{rng.choice(WORDS)}/{name[5:]}">')
+        lines.extend(f'<function name="{rng.choice(WORDS)}_{j}"/>' for j in range(4))
+        lines.append("</class>")
+    lines.append("</index>")
+    return "\n".join(lines)
+
+
+class StandInServer:
+    """Serves recorded or synthetic responses for every upstream host."""
+
+    def __init__(self, *, latency: float = 0.0, inventory_size: int = 20_000, execute_latency: float = 0.05) -> None:
+        self.latency = latency
+        self.execute_latency = execute_latency
+        self.inventory_size = inventory_size
+        self.requests = 0
+        self._inventories = {}
+        self._rust_index = make_rust_index(inventory_size)
+        self._cpp_index = make_cppreference_index(inventory_size)
+        self._discordjs_docs = make_discordjs_docs(inventory_size)
+        self._runner = None
+        self.url = None
+
+        self.app = web.Application()
+        self.app.router.add_route('*', '/{host}/{path:.*}', self.dispatch)
+
+    async def start(self) -> URL:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = URL(f"http://127.0.0.1:{port}")
+        return self.url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def dispatch(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        host, path = request.match_info['host'], '/' + request.match_info['path']
+
+        if path.endswith('/objects.inv'):
+            return self.objects_inv(request, host + path)
+        if host == 'emkc.org' and path.endswith('/versions'):
+            return web.json_response(RUNTIMES)
+        if host == 'emkc.org' and path.endswith('/execute'):
+            return await self.execute(request)
+        if host == 'mystb.in' and path == '/documents':
+            body = await request.read()
+            return web.json_response({"key": hashlib.sha1(body).hexdigest()[:10]})
+        if host == 'doc.rust-lang.org' and path == '/std/index.html':
+            return web.Response(text='<div id="rustdoc-vars" data-search-index-js="../search-index1.0.0.js"></div>',
+                                content_type='text/html')
+        if host == 'doc.rust-lang.org' and path.startswith('/search-index'):
+            return web.Response(text=self._rust_index, content_type='application/javascript')
+        if host == 'raw.githubusercontent.com' and path.startswith('/discordjs/'):
+            return web.Response(text=self._discordjs_docs, content_type='application/json')
+        if host == 'raw.githubusercontent.com' and 'index-functions' in path:
+            return web.Response(text=self._cpp_index, content_type='text/xml')
+        if host == 'cppreference.com':
+            return self.cppreference_search(request)
+        return web.Response(status=404)
+
+    def objects_inv(self, request: web.Request, key: str) -> web.Response:
+        if key not in self._inventories:
+            seed = int(hashlib.sha1(key.encode()).hexdigest()[:8], 16)
+            data = make_inventory(self.inventory_size, project=key.split('/')[0], seed=seed)
+            self._inventories[key] = (data, '"' + hashlib.sha1(data).hexdigest() + '"')
+        data, etag = self._inventories[key]
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=data, headers={'ETag': etag})
+
+    async def execute(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        await asyncio.sleep(self.execute_latency)
+        version = next((r['version'] for r in RUNTIMES if r['name'] == data['language']), '0')
+        return web.json_response({
+            "ran": True,
+            "language": data['language'],
+            "version": version,
+            "output": f"ran {len(data['source'])} characters\n" * (1 + len(data['source']) % 3)
+        })
+
+    def cppreference_search(self, request: web.Request) -> web.Response:
+        query = request.query.get('search', '')
+        items = "".join(f'<li><a href="/w/cpp/{w}/{query}">std::{w}::{query}</a></li>' for w in WORDS[:8])
+        page = f'<html><body><ul class="mw-search-results">{items}</ul><ul class="mw-search-results">{items}</ul>' \
+               f'</body></html>'
+        return web.Response(text=page, content_type='text/html')
+
+
+class StandInSession(aiohttp.ClientSession):
+    """ClientSession that sends every request to a StandInServer instead of the real host."""
+
+    def __init__(self, base: URL, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._standin = base
+
+    def _request(self, method, str_or_url, **kwargs):
+        url = URL(str_or_url)
+        local = self._standin.with_path(f"/{url.host}{url.path}").with_query(url.query)
+        return super()._request(method, local, **kwargs)
+
+
+class FakeBot:
+    """Just enough of core.Bot for the cogs to run outside of Discord."""
+
+    run_cpu = Bot.run_cpu
+    run_threaded = Bot.run_threaded
+
+    def __init__(self, session: aiohttp.ClientSession, settings: Optional[dict] = None) -> None:
+        self.loop = asyncio.get_event_loop()
+        self.session = session
+        self.cwd = tempfile.mkdtemp(prefix='codingassistant-bench-') + '/'
+        self.settings = settings or {}
+        self.http_client = HTTPClient(self.settings.get('http', {}), session=session)
+        self.thread_executor = self.executor = ThreadPoolExecutor(thread_name_prefix='cpu')
+
+    async def wait_until_ready(self) -> None:
+        return None
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class FakeContext:
+    """Records what a command sends instead of talking to Discord."""
+
+    mystbin = Context.mystbin
+
+    def __init__(self, bot: FakeBot, guild_id: int = 1, user_id: int = 1) -> None:
+        self.bot = bot
+        self.prefix = 'yea '
+        self.guild = SimpleNamespace(id=guild_id)
+        self.author = SimpleNamespace(id=user_id)
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        self.sent.append(embed.description if embed is not None else content)
+
+    async def reply(self, content=None, **kwargs):
+        await self.send(content, **kwargs)
+
+    async def trigger_typing(self) -> None:
+        return None
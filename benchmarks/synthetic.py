@@ -0,0 +1,37 @@
+import random
+import zlib
+
+HEADER = (
+    '# Sphinx inventory version 2\n'
+    '# Project: {project}\n'
+    '# Version: 1.0\n'
+    '# The remainder of this file is compressed using zlib.\n'
+)
+WORDS = (
+    'async', 'gather', 'client', 'session', 'request', 'stream', 'reader', 'writer', 'embed', 'channel',
+    'message', 'guild', 'member', 'array', 'frame', 'series', 'index', 'loop', 'task', 'event', 'queue',
+    'buffer', 'parse', 'format', 'context', 'command', 'cog', 'bot', 'view', 'model', 'field', 'query'
+)
+
+
+def make_entries(count: int, seed: int = 0) -> list:
+    """Returns ``count`` objects.inv entry lines shaped like a real Python project."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < count:
+        module = f"pkg.{rng.choice(WORDS)}{rng.randrange(100)}"
+        lines.append(f"{module} py:module 0 api/{module}.html#module-$ -")
+        for _ in range(rng.randrange(1, 20)):
+            cls = f"{module}.{rng.choice(WORDS).title()}{rng.choice(WORDS).title()}"
+            lines.append(f"{cls} py:class 1 api/{module}.html#$ -")
+            for _ in range(rng.randrange(0, 12)):
+                member = f"{cls}.{rng.choice(WORDS)}_{rng.choice(WORDS)}"
+                lines.append(f"{member} py:{rng.choice(('method', 'attribute'))} 1 api/{module}.html#$ -")
+        lines.append(f"{module.replace('.', '-')} std:label -1 api/{module}.html#$ {module} reference")
+    return lines[:count]
+
+
+def make_inventory(count: int, project: str = 'Synthetic', seed: int = 0) -> bytes:
+    """Returns a complete, zlib compressed objects.inv file with ``count`` entries."""
+    body = '\n'.join(make_entries(count, seed)) + '\n'
+    return HEADER.format(project=project).encode('utf-8') + zlib.compress(body.encode('utf-8'), 9)
@@ -1,55 +1,175 @@
 import asyncio
-from typing import Any
+import importlib
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
 
-import aiohttp
 import discord
+import psutil
 import toml
 from discord.ext import commands
 
+from . import metrics
+from .http import HTTPClient
+from .monitor import LagMonitor
+
+CWD = "D:/coding/codingassistant/"
+USER_AGENT = "CodingAssistant Discord bot created by ppotatoo#9688. discord.py version " + discord.__version__
+
+EXTENSIONS = ('extensions.misc',)
+# loaded the first time one of their commands (or help) is invoked
+LAZY_EXTENSIONS = {
+    'jishaku': ('jishaku', 'jsk'),
+    'extensions.code': (
+        'rtfm', 'doc', 'documentation', 'docs', 'rtfs', 'rtm',
+        'run', 'exec', 'compile', 'execute', 'eval', 'e',
+        'runmany', 'runall', 'runqueue', 'execqueue'
+    )
+}
+
+
+def load_settings() -> dict:
+    with open(CWD + "config.toml") as config:
+        return toml.loads(config.read())
+
 
 class Context(commands.Context):
     async def mystbin(self, data: Any):
         data = bytes(str(data), 'utf-8')
-        async with self.bot.session.post('https://mystb.in/documents', data=data) as r:
-            res = await r.json()
-            key = res["key"]
-            return f"https://mystb.in/{key}"
+        resp = await self.bot.http_client.post('https://mystb.in/documents', data=data)
+        resp.raise_for_status()
+        key = resp.json()["key"]
+        return f"https://mystb.in/{key}"
 
 
 class Bot(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
+        # where startup time goes, in seconds per phase
+        self.startup_times = {'interpreter and imports': time.time() - psutil.Process().create_time()}
+        self._started = time.perf_counter()
         super().__init__(*args, **kwargs)
         # core
         self.loop = asyncio.get_event_loop()
-        self.cwd = "D:/coding/codingassistant/"
-        with open(self.cwd + "config.toml") as config:
-            self.settings = toml.loads(config.read())
+        self.cwd = CWD
+        self.settings = load_settings()
+        self.startup_times['bot and config'] = time.perf_counter() - self._started
+        self._lazy_commands = {}
+
+        # CPU bound work (parsing, index builds, searches) goes through these
+        executor = self.settings.get('executor', {})
+        self.thread_executor = ThreadPoolExecutor(executor.get('threads'), thread_name_prefix='cpu')
+        if executor.get('kind', 'thread') == 'process':
+            self.executor = ProcessPoolExecutor(executor.get('processes'))
+        else:
+            self.executor = self.thread_executor
+        self.lag_monitor = LagMonitor(
+            self.loop,
+            interval=executor.get('lag_interval', 0.05),
+            threshold=executor.get('lag_threshold', 0.1)
+        )
+        self.metrics = metrics.registry
+        self._metrics_server = None
 
         self.loop.create_task(self.__asyncinit__())
 
     async def __asyncinit__(self):
-        headers = {
-            "User-agent": "CodingAssistant Discord bot created by ppotatoo#9688. discord.py version " + discord.__version__
-        }
-        self.session = aiohttp.ClientSession(headers=headers)
+        self.http_client = HTTPClient(self.settings.get('http', {}), headers={"User-agent": USER_AGENT},
+                                      trace_configs=[metrics.trace_config()])
+        # for anything that wants a plain ClientSession, e.g. jishaku
+        self.session = self.http_client.session
+        self.lag_monitor.start()
+
+        settings = self.settings.get('metrics', {})
+        if settings.get('port'):
+            try:
+                self._metrics_server = await metrics.start_http_server(settings.get('host', '127.0.0.1'),
+                                                                       settings['port'])
+            except OSError as e:
+                print(f"Could not start the metrics endpoint: {e}")
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """Runs func in the configured executor, which may be a process pool.
+
+        Everything passed in and returned has to be picklable, use run_threaded otherwise.
+        """
+        return await self.loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def run_threaded(self, func: Callable, *args, **kwargs) -> Any:
+        return await self.loop.run_in_executor(self.thread_executor, partial(func, *args, **kwargs))
 
     def run(self):
         self.load_extensions()
         super().run(self.settings['core']['token'])
 
     def load_extensions(self):
-        extensions = (
-            'jishaku',
-            'extensions.code',
-            'extensions.misc'
-        )
-        for ext in extensions:
+        eager = self.settings.get('core', {}).get('eager_extensions', ())
+        for ext in EXTENSIONS + tuple(eager):
+            self._timed_load(ext)
+        for ext, names in LAZY_EXTENSIONS.items():
+            if ext not in eager:
+                self._lazy_commands.update(dict.fromkeys(names, ext))
+
+    def _timed_load(self, ext: str) -> None:
+        start = time.perf_counter()
+        self.load_extension(ext)
+        self.startup_times[f'load {ext}'] = time.perf_counter() - start
+
+    @property
+    def pending_extensions(self) -> set:
+        return set(self._lazy_commands.values())
+
+    async def load_lazy_extension(self, ext: str) -> None:
+        # import off the loop, setup() itself is cheap once the module is cached
+        start = time.perf_counter()
+        await self.run_threaded(importlib.import_module, ext)
+        if ext not in self.extensions:
             self.load_extension(ext)
+        self._lazy_commands = {name: e for name, e in self._lazy_commands.items() if e != ext}
+        self.startup_times[f'lazy load {ext}'] = time.perf_counter() - start
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        name = ctx.command.qualified_name
+        start = time.perf_counter()
+        metrics.commands_in_flight.inc(command=name)
+        try:
+            await super().invoke(ctx)
+        finally:
+            metrics.commands_in_flight.dec(command=name)
+            metrics.commands_seconds.observe(time.perf_counter() - start, command=name,
+                                             failed=ctx.command_failed)
+
+    async def close(self):
+        self.lag_monitor.stop()
+        if self._metrics_server is not None:
+            await self._metrics_server.cleanup()
+        if hasattr(self, 'http_client'):
+            await self.http_client.close()
+        await super().close()
+        self.executor.shutdown(wait=False)
+        self.thread_executor.shutdown(wait=False)
 
     async def on_ready(self):
+        self.startup_times.setdefault('until ready', time.perf_counter() - self._started)
         print("Connected to Discord.")
 
     async def get_context(self, message, *, cls=Context):
+        ctx = await super().get_context(message, cls=cls)
+        if not self._lazy_commands or ctx.prefix is None:
+            return ctx
+        if ctx.invoked_with == 'help':
+            pending = self.pending_extensions
+        elif ctx.command is None and ctx.invoked_with in self._lazy_commands:
+            pending = {self._lazy_commands[ctx.invoked_with]}
+        else:
+            return ctx
+        for ext in pending:
+            try:
+                await self.load_lazy_extension(ext)
+            except (ImportError, commands.ExtensionError) as e:
+                print(f"Could not load {ext}: {e}")
         return await super().get_context(message, cls=cls)
 
     
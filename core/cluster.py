@@ -0,0 +1,225 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from functools import partial
+from typing import List, Optional
+
+import psutil
+
+from . import CWD, USER_AGENT, Bot, load_settings
+from .http import HTTPClient
+
+GATEWAY = "https://discord.com/api/v8/gateway/bot"
+
+
+def shard_ranges(shard_count: int, clusters: int) -> List[List[int]]:
+    """Splits shard ids 0..shard_count-1 into ``clusters`` contiguous, nearly equal ranges."""
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for i in range(clusters):
+        end = start + size + (i < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def report_health(bot: Bot, cluster_id: int, health: multiprocessing.Queue, interval: float) -> None:
+    process = psutil.Process()
+    while not bot.is_closed():
+        try:
+            health.put_nowait({
+                'cluster': cluster_id,
+                'time': time.time(),
+                'ready': bot.is_ready(),
+                'latency': bot.latency,
+                'guilds': len(bot.guilds),
+                'rss': process.memory_info().rss
+            })
+        except queue.Full:
+            pass
+        await asyncio.sleep(interval)
+
+
+def run_cluster(cluster_id: int, shard_ids: List[int], shard_count: int,
+                health: multiprocessing.Queue, options: dict) -> None:
+    """Entry point of a worker process."""
+    bot = Bot(shard_ids=shard_ids, shard_count=shard_count, **options)
+    bot.cluster_id = cluster_id
+    # the launcher keeps the shared inventory store current
+    bot.settings.setdefault('rtfm', {})['revalidate'] = False
+    interval = bot.settings.get('cluster', {}).get('health_interval', 15)
+    bot.loop.create_task(report_health(bot, cluster_id, health, interval))
+    bot.run()
+
+
+class Cluster:
+    def __init__(self, cluster_id: int, shard_ids: List[int]) -> None:
+        self.id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.failures = 0  # in a row, for the backoff
+        self.restart_at: Optional[float] = None
+        self.health = {}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def describe(self) -> str:
+        shards = f"shards {self.shard_ids[0]}-{self.shard_ids[-1]}"
+        if not self.alive:
+            return f"cluster {self.id} ({shards}): down, {self.restarts} restarts"
+        health = self.health
+        if not health:
+            return f"cluster {self.id} ({shards}): starting, pid {self.process.pid}"
+        state = "ready" if health['ready'] else "connecting"
+        return (f"cluster {self.id} ({shards}): {state}, pid {self.process.pid}, {health['guilds']} guilds, "
+                f"{health['latency'] * 1000:.0f}ms, {health['rss'] / 2 ** 20:.0f} MiB, {self.restarts} restarts")
+
+
+class ClusterLauncher:
+    """Runs the bot as several processes, each owning a contiguous range of shards.
+
+    Before any worker starts, every Sphinx inventory is downloaded once into the
+    on-disk InventoryStore, and the workers load from it instead of fetching and
+    parsing their own copies. The launcher keeps revalidating the store, and the
+    workers' refreshers swap in what changed. Workers report health over a queue, and ones that
+    exit or stop reporting are restarted with an exponential backoff.
+    """
+
+    def __init__(self, options: dict, clusters: Optional[int] = None) -> None:
+        self.options = options
+        self.settings = load_settings()
+        settings = self.settings.get('cluster', {})
+        self.cluster_count = clusters or settings.get('clusters') or psutil.cpu_count(logical=False) or 1
+        self.shard_count = settings.get('shard_count')
+        self.health_interval = settings.get('health_interval', 15)
+        self.health_timeout = settings.get('health_timeout', 120)
+        self.max_backoff = settings.get('max_backoff', 300)
+        self.clusters: List[Cluster] = []
+        self._context = multiprocessing.get_context('spawn')
+        self._health = self._context.Queue()
+
+    def run(self) -> None:
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    async def main(self) -> None:
+        if self.shard_count is None:
+            self.shard_count = await self.recommended_shards()
+        await self.prefetch()
+
+        ranges = shard_ranges(self.shard_count, min(self.cluster_count, self.shard_count))
+        self.clusters = [Cluster(i, shard_ids) for i, shard_ids in enumerate(ranges)]
+        print(f"Launching {len(self.clusters)} clusters for {self.shard_count} shards.")
+        for cluster in self.clusters:
+            self.spawn(cluster)
+
+        asyncio.ensure_future(self.refresh_store())
+        while True:
+            await asyncio.sleep(self.health_interval)
+            self.collect_health()
+            self.check()
+            for cluster in self.clusters:
+                print(cluster.describe())
+
+    async def recommended_shards(self) -> int:
+        client = HTTPClient(self.settings.get('http', {}), headers={'User-agent': USER_AGENT})
+        try:
+            resp = await client.get(GATEWAY, headers={'Authorization': f"Bot {self.settings['core']['token']}"})
+        finally:
+            await client.close()
+        if resp.status != 200:
+            raise RuntimeError(f"Could not get the recommended shard count, HTTP Code {resp.status}")
+        return resp.json()['shards']
+
+    async def prefetch(self) -> None:
+        """Downloads every Sphinx inventory into the store the workers read from."""
+        from extensions.code.rtfm import DOCS, FETCH_ERRORS, fetch_inventory, open_store
+
+        store = open_store(self.settings, CWD)
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.settings.get('rtfm', {}).get('warmup_concurrency', 4))
+
+        async def run(func, *args):
+            return await loop.run_in_executor(None, partial(func, *args))
+
+        async def fetch(client: HTTPClient, key: str, url: str) -> None:
+            async with semaphore:
+                stored = store.load(key, url)
+                try:
+                    fresh = await fetch_inventory(client, url, stored, run=run)
+                except FETCH_ERRORS as e:
+                    print(f"Could not prefetch the {key} inventory: {e}")
+                    return
+                if fresh is not None:
+                    store.save(key, fresh.entries, etag=fresh.etag, last_modified=fresh.last_modified)
+
+        start = time.perf_counter()
+        client = HTTPClient(self.settings.get('http', {}), headers={"User-agent": USER_AGENT})
+        try:
+            await asyncio.gather(*(fetch(client, key, doc.url) for key, doc in DOCS.items() if doc.method == 0))
+        finally:
+            await client.close()
+        print(f"Prefetched inventories in {time.perf_counter() - start:.1f}s.")
+
+    async def refresh_store(self) -> None:
+        """Revalidates the shared store every rtfm.refresh_hours, the workers reload from it on their own."""
+        hours = self.settings.get('rtfm', {}).get('refresh_hours', 24)
+        while hours:
+            await asyncio.sleep(hours * 3600)
+            await self.prefetch()
+
+    def spawn(self, cluster: Cluster) -> None:
+        cluster.process = self._context.Process(
+            target=run_cluster,
+            args=(cluster.id, cluster.shard_ids, self.shard_count, self._health, self.options),
+            name=f"cluster-{cluster.id}"
+        )
+        cluster.process.start()
+        cluster.started = time.time()
+        cluster.restart_at = None
+        cluster.health = {}
+
+    def collect_health(self) -> None:
+        while True:
+            try:
+                report = self._health.get_nowait()
+            except queue.Empty:
+                return
+            self.clusters[report['cluster']].health = report
+
+    def check(self) -> None:
+        now = time.time()
+        for cluster in self.clusters:
+            if cluster.alive:
+                last_seen = cluster.health.get('time', cluster.started)
+                if now - last_seen > self.health_timeout:
+                    print(f"Cluster {cluster.id} stopped reporting, terminating it.")
+                    cluster.process.terminate()
+                    cluster.process.join(10)
+                continue
+            if cluster.restart_at is None:
+                # a cluster that stayed up for a while starts over with a short delay
+                cluster.failures = 0 if now - cluster.started > self.max_backoff else cluster.failures + 1
+                delay = min(self.max_backoff, 2 ** cluster.failures)
+                print(f"Cluster {cluster.id} exited with code {cluster.process.exitcode}, restarting in {delay}s.")
+                cluster.restart_at = now + delay
+            elif now >= cluster.restart_at:
+                cluster.restarts += 1
+                self.spawn(cluster)
+
+    def stop(self) -> None:
+        for cluster in self.clusters:
+            if cluster.alive:
+                cluster.process.terminate()
+        for cluster in self.clusters:
+            if cluster.process is not None:
+                cluster.process.join(10)
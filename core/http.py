@@ -0,0 +1,202 @@
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import aiohttp
+from yarl import URL
+
+from . import metrics
+
+# worth another try for an idempotent request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+upstream_retries = metrics.registry.counter('bot_upstream_retries_total', 'HTTP requests that were retried.')
+upstream_coalesced = metrics.registry.counter(
+    'bot_upstream_coalesced_total', 'GETs served by an identical request already in flight.'
+)
+
+
+def _consume_exception(task: asyncio.Future) -> None:
+    # every waiter may have been cancelled, don't warn about an exception nobody read
+    if not task.cancelled():
+        task.exception()
+
+
+class HTTPStatusError(aiohttp.ClientError):
+    """An error status, raised by Response.raise_for_status.
+
+    It's a ClientError, so tasks.loop reconnects retry it like a failed connection.
+    """
+
+    def __init__(self, status: int, url: str) -> None:
+        super().__init__(f"HTTP {status} from {url}")
+        self.status = status
+        self.url = url
+
+
+class Response:
+    """A fully read response, safe to hand to several waiters."""
+
+    __slots__ = ('status', 'headers', 'body', 'url')
+
+    def __init__(self, status: int, headers, body: bytes, url: str) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise HTTPStatusError(self.status, self.url)
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        return self.body.decode(encoding, errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'retries', 'coalesced', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.requests = self.errors = self.retries = self.coalesced = 0
+        self.total = self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        answered = self.requests - self.errors
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'coalesced': self.coalesced,
+            'mean': self.total / answered if answered else 0.0,
+            'max': self.max
+        }
+
+
+class HTTPClient:
+    """The bot's one way out to the internet.
+
+    Wraps a ClientSession with per-host connection limits and timeouts. GETs are
+    retried with jittered exponential backoff on connection errors, timeouts and
+    429/5xx answers, and identical GETs that are already in flight share one request.
+    Other methods go out once. Everything is counted per host.
+    """
+
+    def __init__(self, settings: Optional[dict] = None, *, session: Optional[aiohttp.ClientSession] = None,
+                 headers: Optional[dict] = None, trace_configs=()) -> None:
+        settings = settings or {}
+        self.timeout = aiohttp.ClientTimeout(
+            total=settings.get('total_timeout', 60),
+            connect=settings.get('connect_timeout', 5),
+            sock_read=settings.get('read_timeout', 30)
+        )
+        self.retries = settings.get('retries', 2)
+        self.backoff = settings.get('backoff', 0.5)
+        self.max_backoff = settings.get('max_backoff', 10)
+        if session is None:
+            connector = aiohttp.TCPConnector(
+                limit=settings.get('limit', 100),
+                limit_per_host=settings.get('limit_per_host', 10),
+                keepalive_timeout=settings.get('keepalive_timeout', 30),
+                ttl_dns_cache=settings.get('dns_cache_ttl', 300)
+            )
+            session = aiohttp.ClientSession(connector=connector, headers=headers, timeout=self.timeout,
+                                            trace_configs=list(trace_configs))
+        self.session = session
+        self.hosts: Dict[str, HostStats] = {}
+        self._inflight = {}
+
+    async def close(self) -> None:
+        await self.session.close()
+
+    def _stats(self, url) -> HostStats:
+        host = URL(str(url)).host or ''
+        stats = self.hosts.get(host)
+        if stats is None:
+            stats = self.hosts[host] = HostStats()
+        return stats
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, self.max_backoff)
+
+    async def _send(self, method: str, url, *, retry: bool, read: bool, **kwargs):
+        stats = self._stats(url)
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            stats.requests += 1
+            start = time.perf_counter()
+            try:
+                resp = await self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if read:
+                    try:
+                        body = await resp.read()
+                    finally:
+                        resp.release()
+            except RETRY_ERRORS:
+                stats.errors += 1
+                if attempt + 1 == attempts:
+                    raise
+                delay = self._delay(attempt)
+            else:
+                stats.add(time.perf_counter() - start)
+                if resp.status not in RETRY_STATUSES or attempt + 1 == attempts:
+                    return Response(resp.status, resp.headers, body, str(resp.url)) if read else resp
+                if not read:
+                    resp.release()
+                delay = self._delay(attempt, resp.headers.get('Retry-After'))
+            stats.retries += 1
+            upstream_retries.inc(host=URL(str(url)).host or '')
+            await asyncio.sleep(delay)
+
+    async def get(self, url, *, headers: Optional[dict] = None, params: Optional[dict] = None) -> Response:
+        key = (str(url), tuple(sorted((headers or {}).items())), tuple(sorted((params or {}).items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(
+                self._send('GET', url, retry=True, read=True, headers=headers, params=params)
+            )
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            task.add_done_callback(_consume_exception)
+        else:
+            self._stats(url).coalesced += 1
+            upstream_coalesced.inc(host=URL(str(url)).host or '')
+        return await asyncio.shield(task)
+
+    async def post(self, url, **kwargs) -> Response:
+        return await self._send('POST', url, retry=False, read=True, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url, **kwargs):
+        """Yields the unread ClientResponse, for bodies that are consumed as they arrive.
+
+        GETs are retried until the response starts, not while it is being read.
+        """
+        resp = await self._send(method, url, retry=method == 'GET', read=False, **kwargs)
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        return {host: stats.as_dict() for host, stats in self.hosts.items()}
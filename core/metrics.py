@@ -0,0 +1,208 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import TraceConfig, web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.values: Dict[Labels, float] = {}
+
+    def get(self, **labels) -> float:
+        return self.values.get(_labels(labels), 0.0)
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_format_labels(labels)} {value:g}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self.values[_labels(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Labels, List[int]] = {}  # per bucket, the last one is +Inf
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+            self.sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self.counts.get(_labels(labels), ()))
+
+    def mean(self, **labels) -> float:
+        key = _labels(labels)
+        count = sum(self.counts.get(key, ()))
+        return self.sums[key] / count if count else 0.0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Upper bound of the bucket holding the q-th quantile."""
+        counts = self.counts.get(_labels(labels))
+        if not counts:
+            return 0.0
+        target = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {self.sums[labels]:g}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named metrics, rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name: str, documentation: str, **kwargs) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, documentation, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str = '') -> Counter:
+        return self._get(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str = '') -> Gauge:
+        return self._get(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str = '', buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+commands_seconds = registry.histogram('bot_command_seconds', 'Time spent invoking commands.')
+commands_in_flight = registry.gauge('bot_commands_in_flight', 'Commands currently running.')
+upstream_seconds = registry.histogram('bot_upstream_request_seconds', 'Time spent on HTTP requests to upstreams.')
+upstream_in_flight = registry.gauge('bot_upstream_requests_in_flight', 'HTTP requests currently in flight.')
+upstream_errors = registry.counter('bot_upstream_errors_total', 'HTTP requests that failed without a response.')
+cache_lookups = registry.counter('bot_cache_lookups_total', 'Cache lookups by cache and result.')
+
+
+def trace_config() -> TraceConfig:
+    """aiohttp tracing that feeds the upstream_* metrics, per host."""
+    async def on_start(session, context, params):
+        context.start = time.perf_counter()
+        context.host = params.url.host
+        upstream_in_flight.inc(host=context.host)
+
+    async def on_end(session, context, params):
+        upstream_in_flight.dec(host=context.host)
+        upstream_seconds.observe(time.perf_counter() - context.start, host=context.host,
+                                 method=params.method, status=params.response.status)
+
+    async def on_exception(session, context, params):
+        upstream_in_flight.dec(host=context.host)
+        upstream_errors.inc(host=context.host, method=params.method, error=type(params.exception).__name__)
+
+    config = TraceConfig()
+    config.on_request_start.append(on_start)
+    config.on_request_end.append(on_end)
+    config.on_request_exception.append(on_exception)
+    return config
+
+
+async def start_http_server(host: str = '127.0.0.1', port: int = 9100) -> web.AppRunner:
+    """Serves the registry at /metrics for Prometheus to scrape."""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
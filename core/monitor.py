@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _call_site(frame) -> str:
+    # blame the innermost frame of our own code, the innermost frame otherwise
+    innermost = frame
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(ROOT):
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    path = frame.f_code.co_filename
+    if path.startswith(ROOT):
+        path = os.path.relpath(path, ROOT)
+    return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+class LagMonitor:
+    """Measures how long the event loop is blocked, and by what.
+
+    A task on the loop stamps a heartbeat every ``interval`` seconds. A watchdog
+    thread checks that stamp, and while the loop is more than ``threshold`` seconds
+    late it samples the loop thread's stack to find the blocking call site.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.05, threshold: float = 0.1) -> None:
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.stalls = 0
+        self.blocked = Counter()  # call site: seconds blocked
+        self._beat = time.perf_counter()
+        self._thread_id = None
+        self._task = None
+        self._running = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._task = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='lag-monitor', daemon=True).start()
+
+    def stop(self) -> None:
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        self._thread_id = threading.get_ident()
+        while self._running:
+            self._beat = before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - before - self.interval
+            if lag > self.threshold:
+                self.stalls += 1
+                self.total_lag += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self) -> None:
+        while self._running:
+            time.sleep(self.interval)
+            if self._thread_id is None or time.perf_counter() - self._beat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.blocked[_call_site(frame)] += self.interval
+
+    def worst(self, limit: int = 5) -> List[Tuple[str, float]]:
+        return self.blocked.most_common(limit)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'stalls': self.stalls,
+            'max_lag': self.max_lag,
+            'total_lag': self.total_lag
+        }
@@ -0,0 +1,61 @@
+"""Local symbol index for cppreference, built from cppreference-doc's symbol index XML."""
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, List, Tuple
+
+from extensions.code.index import Inventory, SearchIndex
+
+WIKI_ROOT = "https://en.cppreference.com/w"
+INDEX_URLS = {
+    "c": "https://raw.githubusercontent.com/PeterFeicht/cppreference-doc/master/index-functions-c.xml",
+    "c++": "https://raw.githubusercontent.com/PeterFeicht/cppreference-doc/master/index-functions-cpp.xml"
+}
+# member elements that only describe the parent and don't have pages of their own
+SKIPPED = {"inherits"}
+
+
+def _add_members(entries: Dict[str, str], parent, name: str, link: str) -> None:
+    short = name.rsplit("::", 1)[-1]
+    for child in parent:
+        if child.tag in SKIPPED:
+            continue
+        if child.tag == "constructor":
+            child_name = child.get("name", short)
+        elif child.tag == "destructor":
+            child_name = child.get("name", "~" + short)
+        else:
+            child_name = child.get("name")
+            if not child_name:
+                continue
+
+        child_link = child.get("link", child_name)
+        child_link = link if child_link == "." else f"{link}/{child_link}"
+        entries[f"{name}::{child_name}"] = child_link
+        _add_members(entries, child, f"{name}::{child_name}", child_link)
+
+
+def parse_symbol_index(text: str) -> Inventory:
+    """Parses index-functions-c.xml or index-functions-cpp.xml into an Inventory of wiki links."""
+    entries = {}
+    for element in ElementTree.fromstring(text):
+        name, link = element.get("name"), element.get("link")
+        if not name or not link:
+            continue
+        entries[name] = link
+        _add_members(entries, element, name, link)
+    return Inventory(WIKI_ROOT, entries)
+
+
+class CppReferenceIndex:
+    def __init__(self, inventory: Inventory) -> None:
+        self.inventory = inventory
+        self.index = SearchIndex(inventory.names)
+
+    @classmethod
+    def from_text(cls, text: str) -> 'CppReferenceIndex':
+        return cls(parse_symbol_index(text))
+
+    def __len__(self) -> int:
+        return len(self.inventory)
+
+    def search(self, query: str, limit: int = 8) -> List[Tuple[str, str]]:
+        return [(name, self.inventory[name]) for name in self.index.search(query, limit)]
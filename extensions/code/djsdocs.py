@@ -0,0 +1,53 @@
+"""Local symbol index for discord.js, built from the docs JSON its website is generated from."""
+import json
+from typing import Dict, List, Tuple
+
+from extensions.code.index import Inventory, SearchIndex
+
+DOCS_ROOT = "https://discord.js.org/#/docs/main/stable/"
+INDEX_URL = "https://raw.githubusercontent.com/discordjs/discord.js/docs/stable.json"
+
+
+def _add_members(entries: Dict[str, str], parent: dict, link: str) -> None:
+    name = parent["name"]
+    for kind in ("props", "methods"):
+        for member in parent.get(kind) or ():
+            if not member.get("name") or member.get("access") == "private":
+                continue
+            if member.get("scope") == "static":
+                entries[f"{name}.{member['name']}"] = f"{link}?scope=s-{member['name']}"
+            else:
+                entries[f"{name}#{member['name']}"] = f"{link}?scope={member['name']}"
+    for event in parent.get("events") or ():
+        if event.get("name"):
+            entries[f"{name}#event:{event['name']}"] = f"{link}?scope=e-{event['name']}"
+
+
+def parse_docs(text: str) -> Inventory:
+    """Parses discord.js' docs JSON into an Inventory of classes, typedefs and their members."""
+    data = json.loads(text)
+    entries = {}
+    for kind, path in (("classes", "class"), ("interfaces", "class"), ("typedefs", "typedef")):
+        for item in data.get(kind) or ():
+            if not item.get("name") or item.get("access") == "private":
+                continue
+            link = f"{path}/{item['name']}"
+            entries[item["name"]] = link
+            _add_members(entries, item, link)
+    return Inventory(DOCS_ROOT, entries)
+
+
+class DiscordJsIndex:
+    def __init__(self, inventory: Inventory) -> None:
+        self.inventory = inventory
+        self.index = SearchIndex(inventory.names)
+
+    @classmethod
+    def from_text(cls, text: str) -> 'DiscordJsIndex':
+        return cls(parse_docs(text))
+
+    def __len__(self) -> int:
+        return len(self.inventory)
+
+    def search(self, query: str, limit: int = 8) -> List[Tuple[str, str]]:
+        return [(name, self.inventory[name]) for name in self.index.search(query, limit)]
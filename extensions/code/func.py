@@ -5,6 +5,9 @@ import io
 import os
 import re
 import zlib
+from array import array
+
+from extensions.code.index import Inventory, PackedStrings
 
 
 # I'm too dumb to figure out how tf sphinx works so this is from rapptz/robodanny
@@ -43,6 +46,36 @@ class SphinxObjectFileReader:
                 pos = buf.find(b'\n')
 
 
+# This code mostly comes from the Sphinx repository.
+entry_regex = re.compile(r'(?x)(.+?)\s+(\S*:\S*)\s+(-?\d+)\s+(\S+)\s+(.*)')
+
+
+def iter_object_inv_entries(lines, projname):
+    # yields (name, directive, key, location) for every valid entry line
+    for line in lines:
+        match = entry_regex.match(line.rstrip())
+        if not match:
+            continue
+
+        name, directive, _, location, dispname = match.groups()
+        domain, _, subdirective = directive.partition(':')
+
+        # Most documentation pages have a label
+        if directive == 'std:doc':
+            subdirective = 'label'
+
+        if location.endswith('$'):
+            location = location[:-1] + name
+
+        key = name if dispname == '-' else dispname
+        prefix = f'{subdirective}:' if domain == 'std' else ''
+
+        if projname == 'discord.py':
+            key = key.replace('discord.ext.commands.', '').replace('discord.', '')
+
+        yield name, directive, f'{prefix}{key}', location
+
+
 def parse_object_inv(stream, url):
     # key: URL
     # n.b.: key doesn't have `discord` or `discord.ext.commands` namespaces
@@ -57,21 +90,14 @@ def parse_object_inv(stream, url):
     # next line is "# Project: <name>"
     # then after that is "# Version: <version>"
     projname = stream.readline().rstrip()[11:]
+    stream.skipline()
 
     # next line says if it's a zlib header
     line = stream.readline()
     if 'zlib' not in line:
         raise RuntimeError('Invalid objects.inv file, not z-lib compatible.')
 
-    # This code mostly comes from the Sphinx repository.
-    entry_regex = re.compile(r'(?x)(.+?)\s+(\S*:\S*)\s+(-?\d+)\s+(\S+)\s+(.*)')
-    for line in stream.read_compressed_lines():
-        match = entry_regex.match(line.rstrip())
-        if not match:
-            continue
-
-        name, directive, _, location, dispname = match.groups()
-        domain, _, subdirective = directive.partition(':')
+    for name, directive, key, location in iter_object_inv_entries(stream.read_compressed_lines(), projname):
         if directive == 'py:module' and name in result:
             # From the Sphinx Repository:
             # due to a bug in 1.1 and below,
@@ -80,22 +106,144 @@ def parse_object_inv(stream, url):
             # one is correct
             continue
 
-        # Most documentation pages have a label
-        if directive == 'std:doc':
-            subdirective = 'label'
+        result[key] = os.path.join(url, location)
 
-        if location.endswith('$'):
-            location = location[:-1] + name
+    return result
 
-        key = name if dispname == '-' else dispname
-        prefix = f'{subdirective}:' if domain == 'std' else ''
 
-        if projname == 'discord.py':
-            key = key.replace('discord.ext.commands.', '').replace('discord.', '')
+class SphinxObjectStreamParser:
+    """Incremental version of parse_object_inv, fed raw chunks as they arrive.
 
-        result[f'{prefix}{key}'] = os.path.join(url, location)
+    Only the current chunk and one partial line are ever buffered, and lines are
+    split once per chunk instead of re-slicing the buffer after every line.
+    Entries are packed per chunk in the order they arrive, so no per-entry strings
+    or dict are kept around; close() sorts and deduplicates them into a compact
+    Inventory with the same contents parse_object_inv would return.
+    """
 
-    return result
+    def __init__(self, url):
+        self.url = url
+        self.projname = None
+        self._keys = ([], array('I', [0]))  # (joined chunks, offsets)
+        self._locations = ([], array('I', [0]))
+        self._modules = []  # (position, name) of py:module entries
+        self._header = []
+        self._tail = b''
+        self._decompressor = None
+
+    def _read_header(self):
+        # the first four lines are plain text, everything after them is zlib data
+        while len(self._header) < 4:
+            pos = self._tail.find(b'\n')
+            if pos == -1:
+                return False
+            self._header.append(self._tail[:pos].decode('utf-8').rstrip())
+            self._tail = self._tail[pos + 1:]
+
+        inv_version, project, _, compression = self._header
+        if inv_version != '# Sphinx inventory version 2':
+            raise RuntimeError('Invalid objects.inv file version.')
+        if 'zlib' not in compression:
+            raise RuntimeError('Invalid objects.inv file, not z-lib compatible.')
+        self.projname = project[11:]
+        self._decompressor = zlib.decompressobj()
+        return True
+
+    def _feed_lines(self, data, final=False):
+        lines = (self._tail + data).split(b'\n')
+        self._tail = b'' if final else lines.pop()
+        position = len(self._keys[1]) - 1
+        keys, locations = [], []
+        entries = iter_object_inv_entries((line.decode('utf-8') for line in lines), self.projname)
+        for name, directive, key, location in entries:
+            if directive == 'py:module':
+                # whether it's skipped depends on what came before it, settled in close()
+                self._modules.append((position + len(keys), name))
+            keys.append(key)
+            locations.append(location)
+        for (chunks, offsets), strings in ((self._keys, keys), (self._locations, locations)):
+            end = offsets[-1]
+            for string in strings:
+                end += len(string)
+                offsets.append(end)
+            chunks.append(''.join(strings))
+
+    def _winners(self, keys):
+        # positions of the entries parse_object_inv's dict would end up with, sorted by key
+        data, offsets = keys.data, keys.offsets
+
+        def key_at(i):
+            return data[offsets[i]:offsets[i + 1]]
+
+        order = array('I', sorted(range(len(keys)), key=key_at))  # stable, ties stay in arrival order
+
+        def first(key):
+            lo, hi = 0, len(order)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if key_at(order[mid]) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        skipped = set()
+        for position, name in self._modules:
+            # see parse_object_inv, skipped when an earlier entry that was kept has the module's name as its key
+            i = first(name)
+            while i < len(order) and order[i] < position and key_at(order[i]) == name:
+                if order[i] not in skipped:
+                    skipped.add(position)
+                    break
+                i += 1
+
+        # later duplicates win, like assigning into a dict
+        winners = array('I')
+        previous = None
+        for i in order:
+            if i in skipped:
+                continue
+            key = key_at(i)
+            if key == previous:
+                winners[-1] = i
+            else:
+                winners.append(i)
+                previous = key
+        return winners
+
+    def feed(self, chunk):
+        if self._decompressor is None:
+            self._tail += chunk
+            if not self._read_header():
+                return
+            chunk, self._tail = self._tail, b''
+        self._feed_lines(self._decompressor.decompress(chunk))
+
+    def close(self):
+        if self._decompressor is None:
+            raise RuntimeError('Invalid objects.inv file, incomplete header.')
+        self._feed_lines(self._decompressor.flush(), final=True)
+        keys, locations = (PackedStrings.from_buffers(''.join(chunks), offsets) for chunks, offsets in (
+            self._keys, self._locations
+        ))
+        self._keys = self._locations = None
+        winners = self._winners(keys)
+        names = PackedStrings(keys.data[keys.offsets[i]:keys.offsets[i + 1]] for i in winners)
+        del keys
+        locations = PackedStrings(locations.data[locations.offsets[i]:locations.offsets[i + 1]] for i in winners)
+        return Inventory.from_tables(self.url, names, locations)
+
+
+async def parse_object_inv_stream(content, url, chunk_size=SphinxObjectFileReader.BUFSIZE, run=None):
+    # content is an aiohttp StreamReader, e.g. resp.content
+    # run offloads the CPU bound steps, e.g. Bot.run_threaded
+    parser = SphinxObjectStreamParser(url)
+    async for chunk in content.iter_chunked(chunk_size):
+        if run is None:
+            parser.feed(chunk)
+        else:
+            await run(parser.feed, chunk)
+    return parser.close() if run is None else await run(parser.close)
 
 
 def finder(text, collection, *, key=None):
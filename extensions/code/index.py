@@ -0,0 +1,561 @@
+import heapq
+import os
+import re
+import string
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+# lowercases A-Z only, unlike str.lower it never changes a string's length
+ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class PackedStrings(Sequence):
+    """Read-only list of strings kept in one buffer plus an offset table."""
+
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, strings: Iterable[str] = ()) -> None:
+        offsets = array('I', [0])
+        chunks, parts = [], []
+        pos = 0
+        for value in strings:
+            parts.append(value)
+            pos += len(value)
+            offsets.append(pos)
+            # joined in batches, so strings made on the fly by a generator don't all stay alive
+            if len(parts) == 4096:
+                chunks.append(''.join(parts))
+                parts.clear()
+        chunks.append(''.join(parts))
+        self.data = ''.join(chunks)
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('PackedStrings index out of range')
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
+
+    @classmethod
+    def from_buffers(cls, data: str, offsets: array) -> 'PackedStrings':
+        packed = cls()
+        packed.data, packed.offsets = data, offsets
+        return packed
+
+    def footprint(self) -> int:
+        return sys.getsizeof(self.data) + sys.getsizeof(self.offsets)
+
+    def bisect(self, value: str, lo: int = 0, hi: Optional[int] = None) -> int:
+        # leftmost insertion point of value, the strings must be sorted
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class Inventory(Mapping):
+    """Compact, read-only stand-in for the ``{name: url}`` dict of a parsed inventory.
+
+    The base URL is kept once, names and relative locations live in sorted packed
+    tables, and full URLs are only joined for the names that are looked up.
+    """
+
+    __slots__ = ('url', 'names', 'locations')
+
+    def __init__(self, url: str, entries: Iterable[Tuple[str, str]] = ()) -> None:
+        # later duplicates win, exactly like assigning into a dict
+        if not isinstance(entries, dict):
+            entries = dict(entries)
+        # sorting the bare names instead of (name, location) pairs keeps the peak close to the dict's own size
+        names = sorted(entries)
+        self.url = url
+        self.locations = PackedStrings(entries[name] for name in names)
+        self.names = PackedStrings(names)
+
+    @classmethod
+    def from_tables(cls, url: str, names: PackedStrings, locations: PackedStrings) -> 'Inventory':
+        inventory = cls(url)
+        inventory.names, inventory.locations = names, locations
+        return inventory
+
+    def find(self, name: str) -> int:
+        index = self.names.bisect(name)
+        if index < len(self.names) and self.names[index] == name:
+            return index
+        return -1
+
+    def url_at(self, index: int) -> str:
+        return os.path.join(self.url, self.locations[index])
+
+    def __getitem__(self, name: str) -> str:
+        index = self.find(name)
+        if index == -1:
+            raise KeyError(name)
+        return self.url_at(index)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.find(name) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def footprint(self) -> int:
+        """Approximate size in bytes, comparable with ``dict_footprint``."""
+        return sys.getsizeof(self.url) + self.names.footprint() + self.locations.footprint()
+
+
+def dict_footprint(table: dict) -> int:
+    """Approximate size in bytes of a ``{name: url}`` dict, including its strings."""
+    return sys.getsizeof(table) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in table.items())
+
+
+def diff_names(old: Iterable[str], new: Iterable[str]) -> Tuple[int, int]:
+    """Returns how many names were (added, removed) going from ``old`` to ``new``."""
+    old, new = set(old), set(new)
+    return len(new - old), len(old - new)
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    flags = bin(bits)[:1:-1]  # least significant bit first
+    index = flags.find('1')
+    while index != -1:
+        yield index
+        index = flags.find('1', index + 1)
+
+
+class SearchIndex:
+    """Search structure returning the same ranking as ``finder``.
+
+    Names are sorted and packed once, and every character maps to a bitmap of the
+    names containing it. A query only runs the subsequence regex against names that
+    contain all of its characters, and only the top ``limit`` hits are selected.
+    """
+
+    def __init__(self, names: Iterable[str]) -> None:
+        # an already sorted table (e.g. Inventory.names) is shared instead of copied
+        self.names = names if isinstance(names, PackedStrings) else PackedStrings(sorted(names))
+        size = len(self.names)
+        nbytes = (size + 7) // 8
+        postings = {}
+        # re.IGNORECASE folds a few non-ASCII characters onto ASCII ones (e.g. the
+        # Kelvin sign), so names like that are never pruned.
+        unprunable = bytearray(nbytes)
+        for i, name in enumerate(self.names):
+            byte, bit = i >> 3, 1 << (i & 7)
+            if not name.isascii():
+                unprunable[byte] |= bit
+            for char in set(name.lower()):
+                bits = postings.get(char)
+                if bits is None:
+                    bits = postings[char] = bytearray(nbytes)
+                bits[byte] |= bit
+        self._postings = {char: int.from_bytes(bits, 'little') for char, bits in postings.items()}
+        self._unprunable = int.from_bytes(unprunable, 'little')
+        self._all = (1 << size) - 1
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def candidates(self, text: str) -> int:
+        bits = self._all
+        for char in set(text.lower()):
+            if not char.isascii():
+                continue
+            bits &= self._postings.get(char, 0)
+            if not bits:
+                break
+        return bits | self._unprunable
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[str]:
+        return [self.names[i] for i in self.search_positions(text, limit)]
+
+    def search_positions(self, text: str, limit: Optional[int] = None) -> List[int]:
+        """Like search, but returns positions in ``names`` instead of the names themselves."""
+        text = str(text)
+        regex = re.compile('.*?'.join(map(re.escape, text)), flags=re.IGNORECASE)
+        data, offsets = self.names.data, self.names.offsets
+        matches = []
+        for i in iter_bits(self.candidates(text)):
+            start = offsets[i]
+            match = regex.search(data, start, offsets[i + 1])
+            if match:
+                # names are sorted, so the index doubles as finder's name tie-break
+                matches.append((match.end() - match.start(), match.start() - start, i))
+
+        ranked = sorted(matches) if limit is None else heapq.nsmallest(limit, matches)
+        return [i for _, _, i in ranked]
+
+    def search_many(self, texts: Iterable[str], limit: Optional[int] = None) -> List[List[str]]:
+        """Runs several searches in one pass over the names, returning one result list per text."""
+        queries = []
+        union = 0
+        for text in map(str, texts):
+            bits = self.candidates(text)
+            union |= bits
+            regex = re.compile('.*?'.join(map(re.escape, text)), flags=re.IGNORECASE)
+            queries.append((regex, set(iter_bits(bits)), []))
+
+        data, offsets = self.names.data, self.names.offsets
+        for i in iter_bits(union):
+            start, end = offsets[i], offsets[i + 1]
+            for regex, candidates, matches in queries:
+                if i in candidates and (match := regex.search(data, start, end)):
+                    matches.append((match.end() - match.start(), match.start() - start, i))
+
+        results = []
+        for _, _, matches in queries:
+            ranked = sorted(matches) if limit is None else heapq.nsmallest(limit, matches)
+            results.append([self.names[i] for _, _, i in ranked])
+        return results
+
+
+class PrefixIndex:
+    """Sorted, lowercased completion keys for typeahead.
+
+    Every name is a key, and so is each part of it after a dot, so ``gat`` suggests
+    ``asyncio.gather``. Keys starting with a prefix are one contiguous range; ranges
+    of recent prefixes are remembered, and a longer prefix (the next keystroke) is
+    only bisected inside the range of the one it extends.
+    """
+
+    def __init__(self, names: Sequence[str], cached_ranges: int = 256) -> None:
+        keys = []
+        for i, name in enumerate(names):
+            lowered = name.lower()
+            keys.append((lowered, i))
+            pos = lowered.find('.')
+            while pos != -1:
+                if pos + 1 < len(lowered):
+                    keys.append((lowered[pos + 1:], i))
+                pos = lowered.find('.', pos + 1)
+        keys.sort()
+        self.names = names
+        self.keys = PackedStrings(key for key, _ in keys)
+        self.positions = array('I', (i for _, i in keys))
+        self.cached_ranges = cached_ranges
+        self._ranges = OrderedDict()  # prefix: (lo, hi)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _prefix_end(self, prefix: str, lo: int, hi: int) -> int:
+        # first key in lo:hi that doesn't start with prefix, keys from lo on must be >= prefix
+        size = len(prefix)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.keys[mid][:size] <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, prefix: str) -> Tuple[int, int]:
+        """The ``lo:hi`` slice of ``keys`` starting with ``prefix``, which must be lowercase."""
+        bounds = self._ranges.get(prefix)
+        if bounds is not None:
+            self._ranges.move_to_end(prefix)
+            return bounds
+        lo, hi = 0, len(self.keys)
+        for size in range(len(prefix) - 1, 0, -1):
+            if (shorter := self._ranges.get(prefix[:size])) is not None:
+                lo, hi = shorter
+                break
+        lo = self.keys.bisect(prefix, lo, hi)
+        bounds = self._ranges[prefix] = (lo, self._prefix_end(prefix, lo, hi))
+        if len(self._ranges) > self.cached_ranges:
+            self._ranges.popitem(last=False)
+        return bounds
+
+    def complete(self, prefix: str, limit: int = 25) -> List[str]:
+        """Up to ``limit`` names with a key starting with ``prefix``, in key order."""
+        lo, hi = self.range(prefix.lower())
+        seen = set()
+        results = []
+        for j in range(lo, hi):
+            i = self.positions[j]
+            if i in seen:
+                continue
+            seen.add(i)
+            results.append(self.names[i])
+            if len(results) == limit:
+                break
+        return results
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance counting adjacent swaps as one edit, or ``limit + 1`` once it's over ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            if j > 1 and i > 1 and x == b[j - 2] and a[i - 2] == y:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    found = frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found = found | frontier
+    return found
+
+
+def _hash(text: str) -> int:
+    # str hashes differ between processes, and the index may be built in a worker process
+    return zlib.crc32(text.encode('utf-8', 'surrogatepass'))
+
+
+class SpellIndex:
+    """Typo correction for the dotted parts of names (symmetric delete spelling correction).
+
+    Every part of every name is a word. Each word's first ``prefix_length``
+    characters, with up to ``max_distance`` of them deleted, are hashed into one
+    sorted array; a misspelled word generates its own deletes and only the words
+    sharing one of those hashes have their real edit distance checked, so a lookup
+    costs about the same no matter how many names there are.
+    """
+
+    def __init__(self, names: Iterable[str], max_distance: int = 2, prefix_length: int = 7) -> None:
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        counts = {}
+        for name in names:
+            for part in name.split('.'):
+                if part:
+                    word = part.lower()
+                    if word in counts:
+                        counts[word][0] += 1
+                    else:
+                        counts[word] = [1, part]
+        words = sorted(counts)
+        self.words = PackedStrings(words)
+        self.spellings = PackedStrings(counts[word][1] for word in words)  # as first seen in a name
+        self.counts = array('I', (counts[word][0] for word in words))
+
+        pairs = array('Q')
+        for i, word in enumerate(words):
+            pairs.extend(_hash(delete) << 32 | i for delete in _deletes(word[:prefix_length], max_distance))
+        pairs = sorted(pairs)
+        self.hashes = array('I', (pair >> 32 for pair in pairs))
+        self.ids = array('I', (pair & 0xFFFFFFFF for pair in pairs))
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: object) -> bool:
+        if not isinstance(word, str):
+            return False
+        i = self.words.bisect(word.lower())
+        return i < len(self.words) and self.words[i] == word.lower()
+
+    def lookup(self, word: str, limit: int = 3) -> List[Tuple[str, int]]:
+        """Up to ``limit`` (spelling, distance) pairs for word, closest and most common first."""
+        word = word.lower()
+        candidates = set()
+        for delete in _deletes(word[:self.prefix_length], self.max_distance):
+            key = _hash(delete)
+            lo = bisect_left(self.hashes, key)
+            hi = bisect_right(self.hashes, key, lo)
+            candidates.update(self.ids[lo:hi])
+        found = []
+        for i in candidates:
+            distance = edit_distance(word, self.words[i], self.max_distance)
+            if distance <= self.max_distance:
+                found.append((distance, -self.counts[i], i))
+        return [(self.spellings[i], distance) for distance, _, i in heapq.nsmallest(limit, found)]
+
+    def suggest(self, query: str, limit: int = 3, max_unknown: int = 3) -> List[str]:
+        """Queries with every unknown dotted part of ``query`` replaced by a known word, best first.
+
+        Returns nothing when more than ``max_unknown`` parts are unknown.
+        """
+        parts = query.split('.')
+        unknown = {i for i, part in enumerate(parts) if part and part not in self}
+        if not unknown or len(unknown) > max_unknown:
+            return []
+        # (total distance, -total count, rank of each correction, parts so far); the totals
+        # only grow by what the next part adds, so the best ``limit`` combinations always
+        # extend the best ``limit`` so far
+        beam = [(0, 0, (), ())]
+        for i, part in enumerate(parts):
+            if i not in unknown:
+                beam = [(distance, count, ranks, chosen + (part,)) for distance, count, ranks, chosen in beam]
+                continue
+            corrections = [(spelling, distance, self.counts[self.words.bisect(spelling.lower())])
+                           for spelling, distance in self.lookup(part, limit)]
+            if not corrections:
+                return []
+            beam = heapq.nsmallest(limit, (
+                (distance + extra, count - seen, ranks + (rank,), chosen + (spelling,))
+                for distance, count, ranks, chosen in beam
+                for rank, (spelling, extra, seen) in enumerate(corrections)
+            ))
+        return ['.'.join(chosen) for _, _, _, chosen in beam]
+
+
+class GlobalIndex:
+    """One SearchIndex over the names of several inventories, ranked as a whole.
+
+    A query is a single pass and one bounded heap over every name instead of a scan
+    per inventory. When the query's characters are common, a few regex scans over a
+    marked, case folded copy of the names settle the top results instead, each scan
+    allowing a wider gap between the characters.
+    """
+
+    # the largest gap between two query characters each scan of _by_gap allows
+    TIERS = (0, 4, 8)
+    # how many results are kept for every single character query
+    SINGLES = 8
+    # when the first this many exact matches have enough of them this close to the
+    # start of the name, they're ranked by scanning one offset at a time instead
+    EXACT_SAMPLE = 1000
+    EXACT_OFFSETS = 4
+    # with fewer candidates than this the full pass is cheaper than the scans
+    DIRECT_SEARCH = 30000
+
+    def __init__(self, tables: Mapping) -> None:
+        self.tables = dict(tables)
+        self.keys = list(self.tables)
+        entries = sorted(
+            (name, owner) for owner, table in enumerate(self.tables.values()) for name in table
+        )
+        self.index = SearchIndex(PackedStrings(name for name, _ in entries))
+        self.owners = array('H', (owner for _, owner in entries))
+        self._singles = {}  # char: up to SINGLES (offset, position) of its best names
+        self._marked = self._mark()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _mark(self) -> str:
+        # Every name case folded after a newline, so name i starts at offsets[i] + i + 1,
+        # with the high bit set on the first occurrence of each character in it. Names
+        # with non-ASCII characters are blanked, the regex scores those.
+        names = self.index.names
+        folded = ('\n' + '\n'.join(names)).translate(ASCII_FOLD)
+        marked = bytearray(folded.encode('latin-1', 'replace'))
+        find, singles, size = folded.find, self._singles, self.SINGLES
+        pos = 1
+        for i, name in enumerate(names):
+            if name.isascii():
+                for char in set(folded[pos:pos + len(name)]):
+                    first = find(char, pos)
+                    marked[first] |= 0x80
+                    # a single character always matches with length 1, so the earliest one wins
+                    best = singles.setdefault(char, [])
+                    if len(best) < size or first - pos < best[-1][0]:
+                        insort(best, (first - pos, i))
+                        del best[size:]
+            else:
+                marked[pos:pos + len(name)] = bytes(len(name))
+            pos += len(name) + 1
+        return marked.decode('latin-1')
+
+    def _name_at(self, pos: int) -> int:
+        offsets = self.index.names.offsets
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if offsets[mid] + mid + 1 < pos:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _by_offset(self, pattern: str, last: int, limit: int) -> List[Tuple[int, int, int]]:
+        # Exact matches all have the same length, so they're ranked by offset and then
+        # by name, the order a scan finds them in. There are enough of them at offsets
+        # up to last, so scanning one offset at a time can stop at limit.
+        ranked = []
+        for offset in range(last + 1):
+            for match in re.finditer(f'\\n[^\\n]{{{offset}}}{pattern}', self._marked):
+                span = match.end() - match.start() - 1 - offset
+                ranked.append((span, offset, self._name_at(match.start() + 1)))
+                if len(ranked) == limit:
+                    return ranked
+        return ranked
+
+    def _by_gap(self, needle: str, limit: int) -> Optional[List[Tuple[int, int, int]]]:
+        # The ranking regex's match starts at the first occurrence of the query's first
+        # character and takes the first occurrence of each next one after it. Starting
+        # at the marked first character, with gaps that can't contain the next one, a
+        # scan follows that same chain, and finds every name whose chain has no gap
+        # wider than the tier's.
+        marked = self._marked
+        for gap in self.TIERS:
+            pattern = [re.escape(chr(ord(needle[0]) | 0x80))]
+            for char in needle[1:]:
+                chars = re.escape(char) + re.escape(chr(ord(char) | 0x80))
+                pattern.append(f'[^{chars}\\n]{{0,{gap}}}[{chars}]' if gap else f'[{chars}]')
+            # only names with at most this much gap in total are all found by the scan
+            bound = len(needle) + gap
+            scores = []
+            for match in re.finditer(''.join(pattern), marked):
+                pos = match.start()
+                if match.end() - pos <= bound:
+                    start = marked.rfind('\n', 0, pos) + 1
+                    scores.append((match.end() - pos, pos - start, start))
+                    if not gap and len(scores) == self.EXACT_SAMPLE >= limit:
+                        last = sorted(scores)[limit - 1][1]
+                        if last <= self.EXACT_OFFSETS:
+                            return self._by_offset(''.join(pattern), last, limit)
+            if len(scores) >= limit:
+                ranked = heapq.nsmallest(limit, scores)
+                return [(span, offset, self._name_at(start)) for span, offset, start in ranked]
+        return None
+
+    def _tiered(self, text: str, limit: int) -> Optional[List[int]]:
+        if not text or not text.isascii() or '\n' in text or '\0' in text:
+            return None
+        needle = text.translate(ASCII_FOLD)
+        if len(needle) == 1:
+            if limit > self.SINGLES:
+                return None
+            ranked = [(1, offset, i) for offset, i in self._singles.get(needle, ())]
+        elif bin(self.index.candidates(text)).count('1') <= self.DIRECT_SEARCH:
+            return None
+        elif (ranked := self._by_gap(needle, limit)) is None:
+            return None
+
+        # the marked copy leaves out names with non-ASCII characters
+        regex = re.compile('.*?'.join(map(re.escape, text)), flags=re.IGNORECASE)
+        data, offsets = self.index.names.data, self.index.names.offsets
+        for i in iter_bits(self.index._unprunable):
+            match = regex.search(data, offsets[i], offsets[i + 1])
+            if match:
+                ranked.append((match.end() - match.start(), match.start() - offsets[i], i))
+        return [i for _, _, i in heapq.nsmallest(limit, ranked)]
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """Returns (inventory key, name) pairs, best first."""
+        text = str(text)
+        positions = self._tiered(text, limit) if limit else None
+        if positions is None:
+            positions = self.index.search_positions(text, limit)
+        names = self.index.names
+        return [(self.keys[self.owners[i]], names[i]) for i in positions]
@@ -1,17 +1,35 @@
+import asyncio
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+import zlib
 from core import Bot, Context
+from core.http import HTTPClient
+from core.metrics import cache_lookups
 from dataclasses import dataclass
-from typing import Optional
-from urllib.parse import quote_plus
+from typing import List, Optional, Tuple
+from urllib.parse import quote_plus, urljoin
 
+import aiohttp
 import discord
-from bs4 import BeautifulSoup
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.utils import escape_markdown
-from requests_html import AsyncHTMLSession
 
-from extensions.code.func import SphinxObjectFileReader, finder, parse_object_inv
+from extensions.code.cppreference import INDEX_URLS, CppReferenceIndex
+from extensions.code.djsdocs import DOCS_ROOT as DJS_DOCS_ROOT, INDEX_URL as DJS_INDEX_URL, DiscordJsIndex
+from extensions.code.func import parse_object_inv_stream
+from extensions.code.index import GlobalIndex, Inventory, PrefixIndex, SearchIndex, SpellIndex, diff_names
+from extensions.code.rustdoc import DOCS_ROOT, RustIndex
+from extensions.code.store import InventoryStore, StoredInventory
+from extensions.utils.cache import TTLCache, normalize
 
 NOTHING_FOUND = "Your query returned no results."
+# what fetching an inventory can fail with: an unreachable or slow host, or a bad body
+FETCH_ERRORS = (RuntimeError, ValueError, zlib.error, asyncio.TimeoutError, aiohttp.ClientError)
+# what loading a scraped search index can fail with on top of that: a missing local
+# file, or a page or index whose format changed under the parsers
+INDEX_ERRORS = FETCH_ERRORS + (OSError, ElementTree.ParseError, KeyError, IndexError, TypeError)
 
 
 @dataclass
@@ -31,81 +49,190 @@ class Docs:
 class WebScrapeRTFM:
     def __init__(self, bot, docs: iter):
         self.bot = bot
-        self.cache = {doc: {} for doc in docs}
-
-    async def discordjs(self, ctx: Context, url: str, query: str) -> None:
-        async with ctx.bot.session.get(parse_url(url + query)) as resp:
-            if not resp.ok:
-                await ctx.send(f"Looks like something went wrong here. HTTP Code {resp.status}")
-            data = await resp.json()
-            if not data:
-                await ctx.send(NOTHING_FOUND)
+        settings = bot.settings.get('webscrape', {})
+        cache_dir = settings.get('cache_dir')
+        self.cache = {
+            doc: TTLCache(
+                maxsize=settings.get('cache_size', 256),
+                ttl=settings.get('cache_ttl', 6 * 60 * 60),
+                negative_ttl=settings.get('negative_ttl', 10 * 60),
+                path=os.path.join(cache_dir, quote_plus(doc) + '.json') if cache_dir else None,
+                name=f'webscrape:{doc}'
+            )
+            for doc in docs
+        }
+        self.indexes = {}
+        self._index_failures = {}  # doc: time.monotonic() of the last failed load
+        self._index_locks = {doc: asyncio.Lock() for doc in ("rust", "c", "c++", "discord.js")}
+        self.refresh_indexes.change_interval(hours=settings.get('index_refresh_hours', 24))
+        self.refresh_indexes.start()
+        if cache_dir:
+            self.flush_caches.change_interval(seconds=settings.get('cache_flush_seconds', 60))
+            self.flush_caches.start()
+
+    async def discordjs(self, ctx: Context, url: str, query: str) -> Optional[list]:
+        if "discord.js" not in self.indexes:
+            await ctx.trigger_typing()
+            await self.refresh_index("discord.js", force=False)
+        if (index := self.indexes.get("discord.js")) is None:
+            await ctx.send("The discord.js search index isn't available right now, try again later.")
+            return None
+        return [f"[`{name}`]({link})" for name, link in await self.bot.run_threaded(index.search, query)]
+
+    async def find_rust_index_url(self) -> str:
+        # the search index is versioned, std's landing page says which one is current
+        page_url = DOCS_ROOT + "std/index.html"
+        page = (await self.bot.http_client.get(page_url)).text()
+        if match := re.search(r'data-search-index-js="([^"]+)"', page):
+            return urljoin(page_url, match.group(1))
+        raise RuntimeError("Could not find rustdoc's search index.")
+
+    async def load_rust_index(self) -> RustIndex:
+        settings = self.bot.settings.get('webscrape', {})
+        if path := settings.get('rust_index_path'):
+            with open(path, encoding='utf-8') as f:
+                return await self.bot.run_cpu(RustIndex.from_text, f.read())
+
+        url = settings.get('rust_index_url') or await self.find_rust_index_url()
+        resp = await self.bot.http_client.get(url)
+        if resp.status != 200:
+            raise RuntimeError(f"Could not download rustdoc's search index, HTTP Code {resp.status}")
+        return await self.bot.run_cpu(RustIndex.from_text, resp.text())
+
+    async def load_cppreference_index(self, lang: str) -> CppReferenceIndex:
+        settings = self.bot.settings.get('webscrape', {})
+        option = 'cppreference_' + ('cpp' if lang == 'c++' else 'c')
+        if path := settings.get(option + '_path'):
+            with open(path, encoding='utf-8') as f:
+                return await self.bot.run_cpu(CppReferenceIndex.from_text, f.read())
+
+        resp = await self.bot.http_client.get(settings.get(option + '_url', INDEX_URLS[lang]))
+        if resp.status != 200:
+            raise RuntimeError(f"Could not download the {lang} symbol index, HTTP Code {resp.status}")
+        return await self.bot.run_cpu(CppReferenceIndex.from_text, resp.text())
+
+    async def load_discordjs_index(self) -> DiscordJsIndex:
+        settings = self.bot.settings.get('webscrape', {})
+        if path := settings.get('discordjs_index_path'):
+            with open(path, encoding='utf-8') as f:
+                return await self.bot.run_cpu(DiscordJsIndex.from_text, f.read())
+
+        resp = await self.bot.http_client.get(settings.get('discordjs_index_url', DJS_INDEX_URL))
+        if resp.status != 200:
+            raise RuntimeError(f"Could not download the discord.js docs, HTTP Code {resp.status}")
+        return await self.bot.run_cpu(DiscordJsIndex.from_text, resp.text())
+
+    async def refresh_index(self, doc: str, *, force: bool = True) -> None:
+        async with self._index_locks[doc]:
+            if not force and doc in self.indexes:
                 return
-            results = data['description'].split("\n")[:8]
-            lines = []
-            for result in results:
-                result = result.split(": **[", maxsplit=1)[1]
-                split_ = result.strip("*").split("](")
-                lines.append(f'[`{split_[0]}`]({split_[1].rstrip(")")})')
-
-            await ctx.send(embed=format_embed(lines))
-            self.cache['discord.js'][query] = lines
-
-    #  made by komodo
-    async def rust(self, ctx: Context, url: str, query: str) -> None:
-        url = parse_url(url + query)
-        sess = AsyncHTMLSession()
-        r = await sess.get(url)
-        await r.html.arender() #  This renders the page, JavaScript and all
-        try:
-            results = r.html.find('.search-results')[0].find('tr')
-        except IndexError:
-            await ctx.send(NOTHING_FOUND)
-            return
-        lines = []
-        for i in results[:8]:
-            td = i.find('td', first=True)
-            links = "https://doc.rust-lang.org/" + td.find('a')[0].attrs['href'].replace('..', '')
-            spans = td.find('span')
-            name = ''.join(i.text for i in spans)
-            lines.append(f"[{name}]({links})")
+            # queries don't download a multi-MB index again right after it failed to load
+            failed = self._index_failures.get(doc)
+            retry = self.bot.settings.get('webscrape', {}).get('index_retry_seconds', 5 * 60)
+            if not force and failed is not None and time.monotonic() - failed < retry:
+                return
+            try:
+                if doc == "rust":
+                    self.indexes[doc] = await self.load_rust_index()
+                elif doc == "discord.js":
+                    self.indexes[doc] = await self.load_discordjs_index()
+                else:
+                    self.indexes[doc] = await self.load_cppreference_index(doc)
+            except INDEX_ERRORS as e:
+                print(f"Could not load the {doc} search index: {e}")
+                self._index_failures[doc] = time.monotonic()
+                return
+            self._index_failures.pop(doc, None)
+            self.cache[doc].clear()
+
+    @tasks.loop(hours=24)
+    async def refresh_indexes(self) -> None:
+        for doc in self._index_locks:
+            await self.refresh_index(doc)
+
+    @tasks.loop(seconds=60)
+    async def flush_caches(self) -> None:
+        # the snapshot is taken on the loop, only the disk I/O happens in a thread
+        for cache in self.cache.values():
+            if (items := cache.pending()) is not None:
+                await self.bot.run_threaded(cache.write, items)
+
+    def close(self) -> None:
+        self.refresh_indexes.cancel()
+        self.flush_caches.cancel()
+        for cache in self.cache.values():
+            cache.flush()
+
+    async def rust(self, ctx: Context, url: str, query: str) -> Optional[list]:
+        if "rust" not in self.indexes:
+            await ctx.trigger_typing()
+            await self.refresh_index("rust", force=False)
+        if (index := self.indexes.get("rust")) is None:
+            await ctx.send("The Rust search index isn't available right now, try again later.")
+            return None
+        return [f"[`{item.display}`]({item.url})" for item in await self.bot.run_threaded(index.search, query)]
+
+    async def c_or_cpp(self, ctx: Context, url: str, text: str, lang: str) -> Optional[list]:
+        if (index := self.indexes.get(lang)) is not None:
+            return [f"[`{name}`]({link})" for name, link in await self.bot.run_threaded(index.search, text)]
+        # the local index hasn't loaded (yet), fall back to the wiki's search
+        return await self.search_cppreference(ctx, url, text, lang)
+
+    async def search_cppreference(self, ctx: Context, url: str, text: str, lang: str) -> Optional[list]:
+        resp = await ctx.bot.http_client.get(parse_url(url + "?title=Special:Search&search=" + text))
+        if not resp.ok:
+            await ctx.send(f"Looks like something went wrong here. HTTP Code {resp.status}")
+            return None
+        return await self.bot.run_cpu(parse_cppreference_search, resp.text(), lang)
+
+    async def lookup(self, ctx: Context, doc: str, url: str, query: str) -> Optional[list]:
+        if doc == "discord.js":
+            return await self.discordjs(ctx, url, query)
+        if doc == "rust":
+            return await self.rust(ctx, url, query)
+        if doc in ("c", "c++"):
+            return await self.c_or_cpp(ctx, url, query, doc)
+        raise KeyError("Documentation not found.")
+
+    async def resolve(self, ctx: Context, doc: str, url: str, query: str) -> Optional[list]:
+        cache = self.cache[doc]
+        key = normalize(query)
+        lines = cache.get(key)
+        if lines is None:
+            lines = await self.lookup(ctx, doc, url, query)
+            if lines is not None:
+                # errors were already reported, and aren't worth caching
+                cache.set(key, lines)
+        return lines
+
+    async def do_many(self, ctx: Context, doc: str, url: str, queries: List[str]) -> bool:
+        results = await asyncio.gather(*(self.resolve(ctx, doc, url, query) for query in queries))
+        await ctx.send(embed=format_batch_embed(list(zip(queries, results))))
+        return True
 
+    async def do_other(self, ctx: Context, doc: str, url: str, query: str) -> bool:
+        lines = await self.resolve(ctx, doc, url, query)
+        if lines is None:
+            return True
+        if not lines:
+            await ctx.send(NOTHING_FOUND)
+            return True
         await ctx.send(embed=format_embed(lines))
-        self.cache['rust'][query] = lines
-        await sess.close()
+        return True
 
-    async def c_or_cpp(self, ctx: Context, url: str, text: str, lang: str) -> None:
-        async with ctx.bot.session.get(parse_url(url + "?title=Special:Search&search=" + text)) as resp:
-            if not resp.ok:
-                await ctx.send(f"Looks like something went wrong here. HTTP Code {resp.status}")
-            soup = BeautifulSoup(str(await resp.text()), 'lxml')
 
-        results = soup.find_all('ul', class_='mw-search-results')
-        try:
-            links = results[0 if lang == "c++" else 1].find_all('a', limit=8)
-        except IndexError:
-            await ctx.send(NOTHING_FOUND)
-            return
+def parse_cppreference_search(page: str, lang: str) -> list:
+    # bs4 and lxml are slow to import and only needed on this fallback path
+    from bs4 import BeautifulSoup
 
-        lines = [f"[`{a.string}`](https://en.cppreference.com/{a.get('href')})" for a in links]
-        await ctx.send(embed=format_embed(lines))
-        self.cache[lang][text] = lines
+    soup = BeautifulSoup(page, 'lxml')
+    results = soup.find_all('ul', class_='mw-search-results')
+    try:
+        links = results[0 if lang == "c++" else 1].find_all('a', limit=8)
+    except IndexError:
+        return []
 
-    async def do_other(self, ctx: Context, doc: str, url: str, query: str) -> bool:
-        if lines := self.cache.get(doc, {}).get(query):
-            await ctx.send(embed=format_embed(lines))
-            return True
-        else:
-            if doc == "discord.js":
-                await self.discordjs(ctx, url, query)
-                return True
-            if doc == "rust":
-                await self.rust(ctx, url, query)
-                return True
-            if doc in ("c", "c++"):
-                await self.c_or_cpp(ctx, url, query, doc)
-                return True
-            raise KeyError("Documentation not found.")
+    return [f"[`{a.string}`](https://en.cppreference.com/{a.get('href')})" for a in links]
 
 
 def parse_url(url: str) -> str:
@@ -118,152 +245,245 @@ def format_embed(lines: list) -> discord.Embed:
     return e
 
 
+def split_queries(text: str) -> List[str]:
+    """Splits a comma separated batch of queries, ignoring commas inside brackets (templates, signatures)."""
+    queries, current, depth = [], [], 0
+    for char in text:
+        if char in '<([{':
+            depth += 1
+        elif char in '>)]}':
+            depth = max(0, depth - 1)
+        if char == ',' and not depth:
+            queries.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    queries.append(''.join(current))
+    return list(dict.fromkeys(query.strip() for query in queries if query.strip()))
+
+
+def format_batch_embed(results: List[Tuple[str, Optional[list]]]) -> discord.Embed:
+    e = discord.Embed(colour=discord.Colour.green())
+    names = [query[:256] for query, _ in results]
+    # a field holds 1024 characters and the whole embed 6000, field names included
+    budget = min(1024, (5000 - sum(map(len, names))) // max(1, len(results)))
+    for name, (_, lines) in zip(names, results):
+        kept, size = [], 0
+        for line in lines or ():
+            if size + len(line) + 1 > budget:
+                break
+            kept.append(line)
+            size += len(line) + 1
+        if lines is None:
+            value = "Looks like something went wrong."
+        else:
+            value = "\n".join(kept) or NOTHING_FOUND
+        e.add_field(name=name, value=value, inline=False)
+    return e
+
+
+DOCS = {
+    "Discord.py": Docs(
+        url="https://discordpy.readthedocs.io/en/latest",
+        aliases=("d.py", "dpy"),
+        lang="Python"
+    ),
+    "Python": Docs(
+        url="https://docs.python.org/3",
+        aliases=("py",),
+        lang="Python",
+        _type="Language"
+    ),
+    "ZaneAPI": Docs(
+        url="https://docs.zaneapi.com/en/latest",
+        aliases=("zane",),
+        lang="N/A",
+        _type="API"
+    ),
+    "Pillow": Docs(
+        url="https://pillow.readthedocs.io/en/stable",
+        aliases=("pil",),
+        lang="Python"
+    ),
+    "asyncpg": Docs(
+        url="https://magicstack.github.io/asyncpg/current",
+        lang="Python"
+    ),
+    "Aiohttp": Docs(
+        url="https://docs.aiohttp.org/en/stable",
+        lang="Python"
+    ),
+    "Wand": Docs(
+        url="https://docs.wand-py.org/en/0.6.5",
+        lang="Python"
+    ),
+    "NumPy": Docs(
+        url="https://numpy.org/doc/1.20",
+        aliases=('np',),
+        lang="Python"
+    ),
+    "Rust": Docs(
+        url="https://doc.rust-lang.org/std/?search=",  # url="https://doc.rust-lang.org/std/all.html",
+        doc_url="https://doc.rust-lang.org/std/all.html",
+        method=1,
+        aliases=('rs',),
+        lang="Rust",
+        _type="Language"
+    ),
+    "BeautifulSoup": Docs(
+        url="https://www.crummy.com/software/BeautifulSoup/bs4/doc",
+        aliases=('bs4', 'beautifulsoup4'),
+        lang="Python"
+    ),
+    "Flask": Docs(
+        url="https://flask.palletsprojects.com/en/1.1.x",
+        lang="Python"
+    ),
+    "PyMongo": Docs(
+        url="https://pymongo.readthedocs.io/en/stable",
+        lang="Python"
+    ),
+    "Motor": Docs(
+        url="https://motor.readthedocs.io/en/stable",
+        lang="Python"
+    ),
+    "Yarl": Docs(
+        url="https://yarl.readthedocs.io/en/latest",
+        lang="Python"
+    ),
+    "Wavelink": Docs(
+        url="https://wavelink.readthedocs.io/en/latest",
+        lang="Python"
+    ),
+    "Requests": Docs(
+        url="https://docs.python-requests.org/en/master",
+        lang="Python"
+    ),
+    "SymPy": Docs(
+        url="https://docs.sympy.org/latest",
+        lang="Python"
+    ),
+    "SciPy": Docs(
+        url="https://docs.scipy.org/doc/scipy/reference",
+        lang="Python"
+    ),
+    "Selenium-py": Docs(
+        url="https://www.selenium.dev/selenium/docs/api/py",
+        lang="Python",
+        aliases=('selenium-python',)
+    ),
+    "IPython": Docs(
+        url="https://ipython.readthedocs.io/en/stable",
+        lang="Python"
+    ),
+    "twitchio": Docs(
+        url="https://twitchio.readthedocs.io/en/latest",
+        lang="Python"
+    ),
+    "PRAW": Docs(
+        url="https://praw.readthedocs.io/en/latest",
+        lang="Python"
+    ),
+    "Pandas": Docs(
+        url="https://pandas.pydata.org/pandas-docs/stable",
+        lang="Python"
+    ),
+    "PyGame": Docs(
+        url="https://www.pygame.org/docs",
+        lang="Python"
+    ),
+    "MatPlotLib": Docs(
+        url="https://matplotlib.org/stable",
+        lang="Python"
+    ),
+    "C": Docs(
+        url="https://cppreference.com/w/c",
+        lang="C",
+        _type="Language",
+        method=1
+    ),
+    "C++": Docs(
+        url="https://cppreference.com/w/cpp",
+        lang="C++",
+        _type="Language",
+        aliases=('cpp',),
+        method=1
+    ),
+    "SqlAlchemy": Docs(
+        url="https://docs.sqlalchemy.org/en/14",
+        lang="Python"
+    ),
+    "Discord.js": Docs(
+        url=DJS_DOCS_ROOT,
+        doc_url="https://discord.js.org/#/docs/main/stable/general/welcome",
+        method=1,
+        lang="JavaScript",
+        aliases=("d.js", "djs")
+    )
+}
+
+
+def open_store(settings: dict, cwd: str) -> InventoryStore:
+    return InventoryStore(settings.get('rtfm', {}).get('cache_dir', cwd + 'cache/rtfm'))
+
+
+async def fetch_inventory(client: HTTPClient, url: str, stored: Optional[StoredInventory] = None,
+                          run=None) -> Optional[StoredInventory]:
+    """Downloads and parses url's objects.inv, returns None if ``stored`` is still current."""
+    headers = {}
+    if stored is not None:
+        if stored.etag:
+            headers['If-None-Match'] = stored.etag
+        if stored.last_modified:
+            headers['If-Modified-Since'] = stored.last_modified
+
+    async with client.stream('GET', url + '/objects.inv', headers=headers) as resp:
+        if resp.status == 304 and stored is not None:
+            return None
+        if resp.status != 200:
+            raise RuntimeError('Cannot build rtfm lookup table, try again later.')
+
+        entries = await parse_object_inv_stream(resp.content, url, run=run)
+        return StoredInventory(entries, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+
+
 class RTFM(commands.Cog):
     """Commands for querying documentation from various sources."""
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
-        self._valid_docs = {
-            "Discord.py": Docs(
-                url="https://discordpy.readthedocs.io/en/latest",
-                aliases=("d.py", "dpy"),
-                lang="Python"
-            ),
-            "Python": Docs(
-                url="https://docs.python.org/3",
-                aliases=("py",),
-                lang="Python",
-                _type="Language"
-            ),
-            "ZaneAPI": Docs(
-                url="https://docs.zaneapi.com/en/latest",
-                aliases=("zane",),
-                lang="N/A",
-                _type="API"
-            ),
-            "Pillow": Docs(
-                url="https://pillow.readthedocs.io/en/stable",
-                aliases=("pil",),
-                lang="Python"
-            ),
-            "asyncpg": Docs(
-                url="https://magicstack.github.io/asyncpg/current",
-                lang="Python"
-            ),
-            "Aiohttp": Docs(
-                url="https://docs.aiohttp.org/en/stable",
-                lang="Python"
-            ),
-            "Wand": Docs(
-                url="https://docs.wand-py.org/en/0.6.5",
-                lang="Python"
-            ),
-            "NumPy": Docs(
-                url="https://numpy.org/doc/1.20",
-                aliases=('np',),
-                lang="Python"
-            ),
-            "Rust": Docs(
-                url="https://doc.rust-lang.org/std/?search=",  # url="https://doc.rust-lang.org/std/all.html",
-                doc_url="https://doc.rust-lang.org/std/all.html",
-                method=1,
-                aliases=('rs',),
-                lang="Rust",
-                _type="Language"
-            ),
-            "BeautifulSoup": Docs(
-                url="https://www.crummy.com/software/BeautifulSoup/bs4/doc",
-                aliases=('bs4', 'beautifulsoup4'),
-                lang="Python"
-            ),
-            "Flask": Docs(
-                url="https://flask.palletsprojects.com/en/1.1.x",
-                lang="Python"
-            ),
-            "PyMongo": Docs(
-                url="https://pymongo.readthedocs.io/en/stable",
-                lang="Python"
-            ),
-            "Motor": Docs(
-                url="https://motor.readthedocs.io/en/stable",
-                lang="Python"
-            ),
-            "Yarl": Docs(
-                url="https://yarl.readthedocs.io/en/latest",
-                lang="Python"
-            ),
-            "Wavelink": Docs(
-                url="https://wavelink.readthedocs.io/en/latest",
-                lang="Python"
-            ),
-            "Requests": Docs(
-                url="https://docs.python-requests.org/en/master",
-                lang="Python"
-            ),
-            "SymPy": Docs(
-                url="https://docs.sympy.org/latest",
-                lang="Python"
-            ),
-            "SciPy": Docs(
-                url="https://docs.scipy.org/doc/scipy/reference",
-                lang="Python"
-            ),
-            "Selenium-py": Docs(
-                url="https://www.selenium.dev/selenium/docs/api/py",
-                lang="Python",
-                aliases=('selenium-python',)
-            ),
-            "IPython": Docs(
-                url="https://ipython.readthedocs.io/en/stable",
-                lang="Python"
-            ),
-            "twitchio": Docs(
-                url="https://twitchio.readthedocs.io/en/latest",
-                lang="Python"
-            ),
-            "PRAW": Docs(
-                url="https://praw.readthedocs.io/en/latest",
-                lang="Python"
-            ),
-            "Pandas": Docs(
-                url="https://pandas.pydata.org/pandas-docs/stable",
-                lang="Python"
-            ),
-            "PyGame": Docs(
-                url="https://www.pygame.org/docs",
-                lang="Python"
-            ),
-            "MatPlotLib": Docs(
-                url="https://matplotlib.org/stable",
-                lang="Python"
-            ),
-            "C": Docs(
-                url="https://cppreference.com/w/c",
-                lang="C",
-                _type="Language",
-                method=1
-            ),
-            "C++": Docs(
-                url="https://cppreference.com/w/cpp",
-                lang="C++",
-                _type="Language",
-                aliases=('cpp',),
-                method=1
-            ),
-            "SqlAlchemy": Docs(
-                url="https://docs.sqlalchemy.org/en/14",
-                lang="Python"
-            ),
-            "Discord.js": Docs(
-                url="https://djsdocs.sorta.moe/v2/embed?src=stable&q=",
-                doc_url="https://discord.js.org/#/docs/main/stable/general/welcome",
-                method=1,
-                lang="JavaScript",
-                aliases=("d.js", "djs")
-            )
-        }
+        self._valid_docs = DOCS
         self.rtfm_cache = {item: {} for item in self._valid_docs}
+        self.rtfm_index = {}
+        self._builds = {}
+        self.rtfm_prefix = {}
+        self._prefix_builds = {}
+        self.rtfm_spell = {}
+        self._spell_builds = {}
+        self.global_index = None
+        self._global_build = None
+        self._stored = {}  # key: StoredInventory of what is loaded, for revalidation
+        self._refreshed = {}  # key: time.monotonic() of the last load or refresh
+        settings = self.bot.settings.get('rtfm', {})
+        # (spelling correction, formatted results) of Sphinx lookups, keyed by (doc, table generation, query)
+        self.results = TTLCache(
+            maxsize=settings.get('result_cache_size', 1024),
+            ttl=settings.get('result_cache_ttl', 24 * 60 * 60),
+            negative_ttl=settings.get('result_cache_ttl', 24 * 60 * 60),
+            name='rtfm-results'
+        )
+        self._generations = {}  # key: bumped whenever the table is replaced
+        self.store = open_store(self.bot.settings, self.bot.cwd)
         self.webscrape = WebScrapeRTFM(self.bot,
                                        [m.lower() for m, value in self._valid_docs.items() if value.method == 1])
+        self._warmup = self.bot.loop.create_task(self.warmup()) if settings.get('warmup') else None
+        self.refresh_tables.change_interval(minutes=settings.get('refresh_check_minutes', 10))
+        self.refresh_tables.start()
+
+    def cog_unload(self) -> None:
+        self.webscrape.close()
+        self.refresh_tables.cancel()
+        if self._warmup is not None:
+            self._warmup.cancel()
 
     def get_url(self, key: str, parsing: bool=True) -> str:
         doc = self._valid_docs[key]
@@ -274,26 +494,248 @@ class RTFM(commands.Cog):
                 return doc_url
             return doc.url
 
+    async def set_table(self, key: str, table: Inventory) -> None:
+        index = await self.bot.run_cpu(SearchIndex, table.names)
+        # with a process pool the index comes back with its own copy of the names
+        index.names = table.names
+        self.rtfm_cache[key], self.rtfm_index[key] = table, index
+        # completions and typo corrections are rebuilt from the new table on first use
+        self.rtfm_prefix.pop(key, None)
+        self.rtfm_spell.pop(key, None)
+        # cached results of the old table can't be looked up anymore and age out of the LRU
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    async def build_prefix_index(self, key: str) -> None:
+        table = self.rtfm_cache[key]
+        index = await self.bot.run_cpu(PrefixIndex, table.names)
+        index.names = table.names
+        if self.rtfm_cache[key] is table:
+            self.rtfm_prefix[key] = index
+
+    async def autocomplete(self, key: str, prefix: str, limit: int = 25) -> List[str]:
+        """Names in ``key``'s inventory (or after a dot in them) starting with ``prefix``, for typeahead."""
+        await self.ensure_table(key)
+        if key not in self.rtfm_prefix:
+            task = self._prefix_builds.get(key)
+            if task is None:
+                task = self._prefix_builds[key] = self.bot.loop.create_task(self.build_prefix_index(key))
+                task.add_done_callback(lambda _: self._prefix_builds.pop(key, None))
+            await asyncio.shield(task)
+        index = self.rtfm_prefix.get(key)
+        return index.complete(prefix, limit) if index is not None else []
+
+    async def build_spell_index(self, key: str) -> None:
+        table = self.rtfm_cache[key]
+        settings = self.bot.settings.get('rtfm', {})
+        index = await self.bot.run_cpu(SpellIndex, table.names, settings.get('typo_distance', 2),
+                                       settings.get('typo_prefix_length', 7))
+        if self.rtfm_cache[key] is table:
+            self.rtfm_spell[key] = index
+
+    async def correct(self, key: str, query: str) -> Optional[Tuple[str, List[str]]]:
+        """The first spelling correction of ``query`` with results in ``key``'s inventory, and those results."""
+        if key not in self.rtfm_spell:
+            task = self._spell_builds.get(key)
+            if task is None:
+                task = self._spell_builds[key] = self.bot.loop.create_task(self.build_spell_index(key))
+                task.add_done_callback(lambda _: self._spell_builds.pop(key, None))
+            await asyncio.shield(task)
+        if (spell := self.rtfm_spell.get(key)) is None:
+            return None
+        cache, index = self.rtfm_cache[key], self.rtfm_index[key]
+        settings = self.bot.settings.get('rtfm', {})
+
+        def search() -> Optional[Tuple[str, List[str]]]:
+            for suggestion in spell.suggest(query, max_unknown=settings.get('typo_max_parts', 3)):
+                if matches := index.search(suggestion, 8):
+                    return suggestion, [f'[`{name}`]({cache[name]})' for name in matches]
+            return None
+        return await self.bot.run_threaded(search)
+
+    def _global_is_current(self, tables: dict) -> bool:
+        index = self.global_index
+        return (index is not None and index.tables.keys() == tables.keys()
+                and all(index.tables[key] is table for key, table in tables.items()))
+
+    async def build_global_index(self, tables: dict) -> None:
+        index = await self.bot.run_cpu(GlobalIndex, tables)
+        # like set_table, keep the loaded tables rather than a process pool's copies
+        index.tables = tables
+        self.global_index = index
+
+    async def ensure_global_index(self) -> Optional[GlobalIndex]:
+        """Returns an index over every loaded inventory, rebuilding it if one was (re)loaded since."""
+        tables = {key: table for key, table in self.rtfm_cache.items() if table}
+        if not tables:
+            return None
+        if not self._global_is_current(tables):
+            if self._global_build is None:
+                self._global_build = self.bot.loop.create_task(self.build_global_index(tables))
+                self._global_build.add_done_callback(lambda _: setattr(self, '_global_build', None))
+            await asyncio.shield(self._global_build)
+        return self.global_index
+
     async def build_table(self, key: str) -> None:
-        url = self.get_url(key)
-        async with self.bot.session.get(url + '/objects.inv') as resp:
-            if resp.status != 200:
-                raise RuntimeError('Cannot build rtfm lookup table, try again later.')
+        stored = self.store.load(key, self.get_url(key))
+        if stored is None:
+            await self.fetch_table(key)
+            return
+        # serve the saved copy straight away, upstream is only asked whether it changed
+        await self.set_table(key, stored.entries)
+        self._remember(key, stored)
+        # in cluster mode the launcher keeps the store current for every worker
+        if self.bot.settings.get('rtfm', {}).get('revalidate', True):
+            self.bot.loop.create_task(self.revalidate_table(key, stored))
+
+    async def ensure_table(self, key: str) -> None:
+        # concurrent lookups of an unloaded doc all wait on the same build
+        if self.rtfm_cache[key]:
+            return
+        task = self._builds.get(key)
+        if task is None:
+            task = self._builds[key] = self.bot.loop.create_task(self.build_table(key))
+            task.add_done_callback(lambda _: self._builds.pop(key, None))
+        await asyncio.shield(task)
+
+    async def warmup(self) -> None:
+        """Loads every Sphinx inventory in the background once the bot is ready."""
+        await self.bot.wait_until_ready()
+        settings = self.bot.settings.get('rtfm', {})
+        priority = [self.valid_docs.get(doc.lower(), doc) for doc in settings.get('warmup_priority', ())]
+        keys = [key for key, doc in self._valid_docs.items() if doc.method == 0]
+        keys.sort(key=lambda k: priority.index(k) if k in priority else len(priority))
+        semaphore = asyncio.Semaphore(settings.get('warmup_concurrency', 4))
+
+        async def warm(key: str) -> None:
+            async with semaphore:
+                try:
+                    await self.ensure_table(key)
+                except FETCH_ERRORS as e:
+                    print(f"Could not warm up the {key} inventory: {e}")
+
+        await asyncio.gather(*map(warm, keys))
+
+    async def fetch_table(self, key: str, stored: StoredInventory = None) -> None:
+        fresh = await fetch_inventory(self.bot.http_client, self.get_url(key), stored, run=self.bot.run_threaded)
+        if fresh is None:
+            if not self.rtfm_cache[key]:
+                await self.set_table(key, stored.entries)
+            self._remember(key, stored)
+            return
+        await self.set_table(key, fresh.entries)
+        self._remember(key, fresh)
+        self.store.save(key, fresh.entries, etag=fresh.etag, last_modified=fresh.last_modified)
 
-            stream = SphinxObjectFileReader(await resp.read())
-            self.rtfm_cache[key] = parse_object_inv(stream, url)
+    def _remember(self, key: str, stored: StoredInventory) -> None:
+        self._stored[key] = stored
+        self._refreshed[key] = time.monotonic()
 
-    async def from_sphinx(self, ctx: Context, key: str, obj: str):
-        if not self.rtfm_cache[key]:
-            await ctx.trigger_typing()
-            await self.build_table(key)
+    async def refresh_table(self, key: str) -> None:
+        """Revalidates a loaded inventory and swaps in the new version if there is one."""
+        old, current = self.rtfm_cache[key], self._stored.get(key)
+        url = self.get_url(key)
+        if self.bot.settings.get('rtfm', {}).get('revalidate', True):
+            fresh = await fetch_inventory(self.bot.http_client, url, current, run=self.bot.run_threaded)
+            if fresh is not None:
+                self.store.save(key, fresh.entries, etag=fresh.etag, last_modified=fresh.last_modified)
+        else:
+            # cluster workers pick up whatever the launcher saved last
+            fresh = await self.bot.run_threaded(self.store.load, key, url)
+            if fresh is not None and current is not None and \
+                    (fresh.etag, fresh.last_modified) == (current.etag, current.last_modified):
+                fresh = None
+        self._refreshed[key] = time.monotonic()
+        if fresh is None:
+            return
 
-        cache = list(self.rtfm_cache[key].items())
-        matches = finder(obj, cache, key=lambda t: t[0])[:8]
+        added, removed = await self.bot.run_cpu(diff_names, old.names, fresh.entries.names)
+        # the index is built before anything is swapped, queries keep using the old one until then
+        await self.set_table(key, fresh.entries)
+        self._stored[key] = fresh
+        print(f"Refreshed the {key} inventory: {added} entries added, {removed} removed.")
+
+    @tasks.loop(minutes=10)
+    async def refresh_tables(self) -> None:
+        settings = self.bot.settings.get('rtfm', {})
+        default = settings.get('refresh_hours', 24)
+        per_doc = settings.get('refresh_hours_per_doc', {})
+        now = time.monotonic()
+        due = []
+        for key, table in self.rtfm_cache.items():
+            hours = per_doc.get(key, default)
+            if table and hours and key in self._refreshed and now - self._refreshed[key] >= hours * 3600:
+                due.append(key)
+
+        semaphore = asyncio.Semaphore(settings.get('warmup_concurrency', 4))
+
+        async def refresh(key: str) -> None:
+            async with semaphore:
+                try:
+                    await self.refresh_table(key)
+                except FETCH_ERRORS as e:
+                    print(f"Could not refresh the {key} inventory: {e}")
+
+        await asyncio.gather(*map(refresh, due))
+
+    async def revalidate_table(self, key: str, stored: StoredInventory) -> None:
+        try:
+            await self.fetch_table(key, stored)
+        except FETCH_ERRORS as e:
+            print(f"Could not revalidate the {key} inventory: {e}")
+
+    async def load_table(self, ctx: Context, key: str) -> None:
+        loaded = bool(self.rtfm_cache[key])
+        cache_lookups.inc(cache=f'rtfm:{key}', result='hit' if loaded else 'miss')
+        if not loaded:
+            await ctx.trigger_typing()
+            await self.ensure_table(key)
+
+    def _result_key(self, key: str, query: str) -> tuple:
+        # the search ignores case but not whitespace inside the query
+        return key, self._generations.get(key, 0), query.strip().lower()
+
+    async def lookup(self, key: str, cache: Inventory, query: str,
+                     matches: List[str]) -> Tuple[Optional[str], List[str]]:
+        """Formats matches from ``cache``, falling back to a spelling correction of the query when there are none."""
+        if matches:
+            return None, [f'[`{name}`]({cache[name]})' for name in matches]
+        if self.bot.settings.get('rtfm', {}).get('typo_correction', True):
+            if (correction := await self.correct(key, query)) is not None:
+                return correction
+        return None, []
 
-        if len(matches) == 0:
+    async def from_sphinx(self, ctx: Context, key: str, obj: str):
+        await self.load_table(ctx, key)
+        result_key = self._result_key(key, obj)
+        result = self.results.get(result_key)
+        if result is None:
+            cache = self.rtfm_cache[key]
+            matches = await self.bot.run_threaded(self.rtfm_index[key].search, obj, 8)
+            result = await self.lookup(key, cache, obj, matches)
+            self.results.set(result_key, result)
+
+        corrected, lines = result
+        if len(lines) == 0:
             return await ctx.send(NOTHING_FOUND)
-        await ctx.send(embed=format_embed([f'[`{key}`]({url})' for key, url in matches]))
+        content = f"Nothing matched `{obj}`, showing results for `{corrected}`." if corrected else None
+        await ctx.send(content, embed=format_embed(lines))
+
+    async def from_sphinx_many(self, ctx: Context, key: str, queries: List[str]):
+        await self.load_table(ctx, key)
+        result_keys = [self._result_key(key, query) for query in queries]
+        results = [self.results.get(result_key) for result_key in result_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            cache = self.rtfm_cache[key]
+            # one pass over the index answers every query that wasn't cached
+            found = await self.bot.run_threaded(self.rtfm_index[key].search_many, [queries[i] for i in missing], 8)
+            for i, matches in zip(missing, found):
+                results[i] = await self.lookup(key, cache, queries[i], matches)
+                self.results.set(result_keys[i], results[i])
+        await ctx.send(embed=format_batch_embed([
+            (f"{query} -> {corrected}" if corrected else query, lines)
+            for query, (corrected, lines) in zip(queries, results)
+        ]))
 
     async def do_rtfm(self, ctx: Context, key: str, obj: str):
         if obj is None:
@@ -301,6 +743,19 @@ class RTFM(commands.Cog):
             return
 
         method = self._valid_docs[key].method
+        queries = split_queries(obj)[:self.bot.settings.get('rtfm', {}).get('max_queries', 10)]
+        if not queries:
+            await ctx.send(self.get_url(key, False))
+            return
+        if len(queries) > 1:
+            if method == 0:
+                await self.from_sphinx_many(ctx, key, queries)
+            if method == 1:
+                await self.webscrape.do_many(ctx, key.lower(), self.get_url(key), queries)
+            return
+
+        # a trailing comma or a repeated query still leaves just the one
+        obj = queries[0]
         if method == 0:
             await self.from_sphinx(ctx, key, obj)
         if method == 1:
@@ -327,7 +782,7 @@ class RTFM(commands.Cog):
         usage="<documentation> <query>"
     )
     async def rtfm(self, ctx: Context, documentation: str=None, *, query: str=None) -> None:
-        """Sends documentation based on an entity."""
+        """Sends documentation based on an entity, or several separated by commas."""
         if documentation is None and query is None:
             await self.valid(ctx)
             return
@@ -365,5 +820,61 @@ class RTFM(commands.Cog):
         ]
         if aliases := info.aliases:
             desc.append("Aliases: `" + "`, `".join(aliases) + "`")
+        if table := self.rtfm_cache.get(proper_doc):
+            desc.append(f"Loaded entries: {len(table):,} ({table.footprint() / 1024:,.0f} KiB)")
         embed.description = "\n".join(desc)
         await ctx.send(embed=embed)
+
+    @rtfm.command(name='all', aliases=('global',))
+    async def search_all(self, ctx: Context, *, query: str):
+        """Searches every loaded Sphinx documentation at once."""
+        if not self._global_is_current({key: table for key, table in self.rtfm_cache.items() if table}):
+            await ctx.trigger_typing()
+        index = await self.ensure_global_index()
+        if index is None:
+            await ctx.send("No documentation has been loaded yet, query one with rtfm first.")
+            return
+        results = await self.bot.run_threaded(index.search, query, 8)
+        if not results:
+            await ctx.send(NOTHING_FOUND)
+            return
+
+        embed = format_embed([f'[`{name}`]({index.tables[key][name]}) ({key})' for key, name in results])
+        sphinx_docs = sum(doc.method == 0 for doc in self._valid_docs.values())
+        embed.set_footer(text=f"Searched {len(index.tables)} of {sphinx_docs} documentations.")
+        await ctx.send(embed=embed)
+
+    @rtfm.command()
+    async def complete(self, ctx: Context, documentation: str, *, prefix: str = ''):
+        """Suggests names from a Sphinx documentation that start with a prefix."""
+        documentation = documentation.lower()
+        if documentation not in self.valid_docs or self._valid_docs[self.get_key(documentation)].method != 0:
+            await self.valid(ctx)
+            return
+        key = self.get_key(documentation)
+        if not self.rtfm_cache[key]:
+            await ctx.trigger_typing()
+        suggestions = await self.autocomplete(key, prefix)
+        if not suggestions:
+            await ctx.send(NOTHING_FOUND)
+            return
+        await ctx.send(embed=format_embed([f'`{name}`' for name in suggestions]))
+
+    @rtfm.command(name='cache')
+    async def cache_stats(self, ctx: Context):
+        """Shows how well the documentation result caches are doing."""
+        embed = discord.Embed(title="Documentation cache", color=discord.Color.blurple())
+        stats = self.results.stats
+        embed.add_field(
+            name="sphinx results",
+            value=f"{stats['size']} cached\n{stats['hits']} hits, {stats['misses']} misses\n"
+                  f"{stats['evictions']} evictions ({stats['hit_ratio']:.0%} hit ratio)"
+        )
+        for doc, cache in self.webscrape.cache.items():
+            stats = cache.stats
+            embed.add_field(
+                name=doc,
+                value=f"{stats['size']} cached\n{stats['hits']} hits, {stats['misses']} misses\n"
+                      f"{stats['evictions']} evictions ({stats['hit_ratio']:.0%} hit ratio)"
+            )
+        await ctx.send(embed=embed)
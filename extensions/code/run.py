@@ -1,11 +1,50 @@
-from requests.models import ContentDecodingError
 from core import Bot, Context
+import asyncio
+import hashlib
 import re
-from typing import Optional
+import time
+from typing import List, Optional, Tuple
 
 from discord.ext import commands, tasks
 
 from ..utils import codeblock
+from ..utils.cache import TTLCache
+from .scheduler import ExecutionScheduler, QueueFull
+
+PISTON = "https://emkc.org/api/v1/piston/"
+CACHEABLE_LANGUAGES = (
+    'python3', 'python2', 'javascript', 'typescript', 'ruby', 'lua', 'c', 'cpp', 'rust', 'go', 'java'
+)
+# anything that smells like input, time, randomness or the environment makes a run uncacheable
+NONDETERMINISTIC = re.compile(
+    # inside longer names too, e.g. currentTimeMillis, nanoTime, HashMap, RandomState
+    r'time|nano|milli|clock|date|rand|seed|uuid|hash|'
+    r'\b(now|instant|sleep|input|stdin|scanf|gets|getline|readline|read_line|env\w*|getenv|'
+    r'id|thread\w*|process|sys|os|fs|net|http\w*|socket|fetch|request\w*|open)\b'
+    # every Java and most C mains declare these, only reading them counts
+    r'|\b(argv|args)\s*\[',
+    re.IGNORECASE
+)
+# str hashes are randomized, so are set orders, and object() prints an address
+PYTHON_UNSTABLE = re.compile(r'\b(frozen)?set\s*\(|\bobject\s*\(\s*\)|\{[^{}:]*(,|\bfor\b)[^{}:]*\}')
+# per language, what iterates or prints in a different order or form from run to run
+UNSTABLE_OUTPUT = {
+    'python3': PYTHON_UNSTABLE,
+    'python2': PYTHON_UNSTABLE,
+    # maps range in random order, goroutines and select are scheduled
+    'go': re.compile(r'\bmap\s*\[|\bgo\s+\w|\bselect\s*\{'),
+    'java': re.compile(r'\bnew\s+Object\s*\(\s*\)'),
+    'lua': re.compile(r'\bpairs\s*\('),
+    'c': re.compile(r'%p'),
+    'cpp': re.compile(r'%p|unordered_'),
+}
+# ```lang\n...``` with the language tag right after the fence
+CODE_BLOCK = re.compile(r'```([^\s`]*)[^\S\n]*\n(.*?)```', re.DOTALL)
+
+
+def parse_blocks(text: str) -> List[Tuple[str, str]]:
+    """Returns (language, source) for every fenced code block in text, in order."""
+    return [(language.lower(), source) for language, source in CODE_BLOCK.findall(text)]
 
 
 class ExecuteCode(commands.Cog):
@@ -13,23 +52,92 @@ class ExecuteCode(commands.Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
         self.languages = {}
+        self.versions = {}
+        self.prepared = asyncio.Event()  # set once the first prep has filled in the languages
+        settings = self.bot.settings.get('run', {})
+        self.results = None
+        if settings.get('cache'):
+            self.results = TTLCache(maxsize=settings.get('cache_size', 512), ttl=settings.get('cache_ttl', 24 * 60 * 60),
+                                    name='run')
+        self.cacheable = set(settings.get('cache_languages', CACHEABLE_LANGUAGES))
+        self.scheduler = ExecutionScheduler(
+            limit=settings.get('concurrency', 4),
+            max_queue=settings.get('max_queue', 50),
+            timeout=settings.get('timeout', 30)
+        )
         self.prep.start()
 
     @tasks.loop(hours=24)
     async def prep(self) -> None:
-        async with self.bot.session.get("https://emkc.org/api/v1/piston/versions") as resp:
-            runtimes = await resp.json()
+        resp = await self.bot.http_client.get(PISTON + "versions")
+        resp.raise_for_status()
+        runtimes = resp.json()
         for runtime in runtimes:
             language = runtime['name']
             self.languages[language] = language
+            self.versions[language] = runtime.get('version')
             for alias in runtime['aliases']:
                 if alias != language:
                     self.languages[alias] = language
+        self.prepared.set()
+
+    async def wait_for_languages(self, ctx: Context) -> bool:
+        """Waits for the language list when the cog was only just loaded, returns False if it never came."""
+        if self.prepared.is_set():
+            return True
+        await ctx.trigger_typing()
+        try:
+            await asyncio.wait_for(self.prepared.wait(), self.bot.settings.get('run', {}).get('prep_timeout', 15))
+        except asyncio.TimeoutError:
+            await ctx.reply("Couldn't get the list of languages yet, try again in a bit.", mention_author=False)
+            return False
+        return True
+
+    async def execute(self, language: str, source: str) -> Tuple[int, dict]:
+        data = {
+            "language": language,
+            "source": source,
+            "log": 0
+        }
+        resp = await self.bot.http_client.post(PISTON + "execute", json=data)
+        return resp.status, resp.json()
+
+    async def schedule(self, ctx: Context, language: str, source: str) -> Optional[Tuple[int, dict]]:
+        """Executes source through the scheduler, returns None if the user was told it couldn't."""
+        async def queued(position: int) -> None:
+            await ctx.reply(f"Lots of code is running right now, you're #{position} in the queue.",
+                            mention_author=False)
+
+        guild = ctx.guild.id if ctx.guild else None
+        try:
+            return await self.scheduler.run(guild, ctx.author.id, self.execute, language, source, on_queued=queued)
+        except QueueFull:
+            await ctx.reply("Too much code is queued up right now, try again in a bit.", mention_author=False)
+        except asyncio.TimeoutError:
+            await ctx.reply(f"Your code took longer than {self.scheduler.timeout:g} seconds to come back.",
+                            mention_author=False)
+        return None
+
+    def cache_key(self, language: str, source: str) -> Optional[str]:
+        """Returns the result cache key for a run, or None if it can't be cached."""
+        if self.results is None or language not in self.cacheable or not self.versions.get(language):
+            return None
+        if NONDETERMINISTIC.search(source):
+            return None
+        unstable = UNSTABLE_OUTPUT.get(language)
+        if unstable is not None and unstable.search(source):
+            return None
+        normalized = "\n".join(line.rstrip() for line in source.strip().splitlines())
+        digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        # the version is part of the key, so a runtime upgrade bypasses old results
+        return f"{language}:{self.versions[language]}:{digest}"
 
     @commands.command(aliases=('exec', 'compile', 'execute', 'eval', 'e'))
     @commands.max_concurrency(1, commands.BucketType.user)
     @commands.cooldown(1, 5, commands.BucketType.user)
     async def run(self, ctx: Context, language: str, *, code: str) -> None:
+        if not await self.wait_for_languages(ctx):
+            return
         language = language.strip('`').lower()
         if language not in self.languages:
             await ctx.send(f"Unsupported Language: **{language}**")
@@ -39,19 +147,23 @@ class ExecuteCode(commands.Cog):
         if re.fullmatch(r'( |[0-9A-z]*)\b', first_line):
             code = code[len(first_line) + 1:]
 
-        data = {
-            "language": language,
-            "source": code.strip('`'),
-            "log": 0
-        }
-        async with self.bot.session.post("https://emkc.org/api/v1/piston/execute", json=data) as resp:
-            data = await resp.json()
-            if not resp.ok:
-                msg = f"```yaml\nThe API seems to be having an issue.\nStatus: {resp.status}"
-                if r_msg := data.get('message'):
-                    msg += f"\nMessage: {r_msg}"
-                await ctx.reply(msg + '```', mention_author=False)
-                return
+        source = code.strip('`')
+        key = self.cache_key(language, source)
+        if key is not None and (cached := self.results.get(key)) is not None:
+            status, data = 200, cached
+        elif result := await self.schedule(ctx, language, source):
+            status, data = result
+            if key is not None and status < 400:
+                self.results.set(key, data)
+        else:
+            return
+
+        if status >= 400:
+            msg = f"```yaml\nThe API seems to be having an issue.\nStatus: {status}"
+            if r_msg := data.get('message'):
+                msg += f"\nMessage: {r_msg}"
+            await ctx.reply(msg + '```', mention_author=False)
+            return
 
         if not (output := data['output']):
             return await ctx.reply("Your code ran without output.", mention_author=False)
@@ -67,3 +179,83 @@ class ExecuteCode(commands.Cog):
             f"{output}"
         )
         await ctx.reply(codeblock(message, lang='yaml'), mention_author=False)
+
+    @commands.command(aliases=('runall',))
+    @commands.max_concurrency(1, commands.BucketType.user)
+    @commands.cooldown(1, 10, commands.BucketType.user)
+    async def runmany(self, ctx: Context, *, code: str) -> None:
+        """Runs several code blocks at once, each one tagged with its own language."""
+        settings = self.bot.settings.get('run', {})
+        blocks = parse_blocks(code)
+        if not blocks:
+            await ctx.send("Put each snippet in its own code block with a language, like ```py\nprint(1)```")
+            return
+        max_blocks = settings.get('max_blocks', 5)
+        if len(blocks) > max_blocks:
+            await ctx.send(f"You can run up to {max_blocks} code blocks at once.")
+            return
+        if not await self.wait_for_languages(ctx):
+            return
+
+        # each block still goes through the scheduler, this only bounds how many one command queues at a time
+        fan_out = asyncio.Semaphore(settings.get('max_parallel', 3))
+        guild = ctx.guild.id if ctx.guild else None
+        told = False
+
+        async def queued(position: int) -> None:
+            nonlocal told
+            if not told:
+                told = True
+                await ctx.reply(f"Lots of code is running right now, you're #{position} in the queue.",
+                                mention_author=False)
+
+        async def run_block(number: int, language: str, source: str) -> Tuple[str, str]:
+            if language not in self.languages:
+                return f"#{number} {language or 'no language'}", "Unsupported Language"
+            language = self.languages[language]
+            key = self.cache_key(language, source)
+            start = time.perf_counter()
+            if key is not None and (cached := self.results.get(key)) is not None:
+                status, data = 200, cached
+            else:
+                async with fan_out:
+                    try:
+                        status, data = await self.scheduler.run(guild, ctx.author.id, self.execute, language,
+                                                                source, on_queued=queued)
+                    except QueueFull:
+                        return f"#{number} {language.capitalize()}", "Too much code is queued up right now."
+                    except asyncio.TimeoutError:
+                        return (f"#{number} {language.capitalize()}",
+                                f"Took longer than {self.scheduler.timeout:g} seconds to come back.")
+                if key is not None and status < 400:
+                    self.results.set(key, data)
+            title = f"#{number} {language.capitalize()} {data.get('version')} ({time.perf_counter() - start:.2f}s)"
+            if status >= 400:
+                return title, f"The API seems to be having an issue. Status: {status} {data.get('message') or ''}"
+            return title, data['output'].strip() or "Ran without output."
+
+        results = await asyncio.gather(*(
+            run_block(number, language, source) for number, (language, source) in enumerate(blocks, 1)
+        ))
+        message = "\n\n".join(f"{title}\n{output}" for title, output in results)
+        if len(message) > 1800 or any(len(output) > 1000 for _, output in results):
+            # one paste for everything instead of one per long output
+            url = await ctx.mystbin("\n\n".join(f"# {title}\n{output}" for title, output in results))
+            summary = "\n".join(title for title, _ in results)
+            await ctx.reply(f"{codeblock(summary, lang='yaml')}The output was long, so I uploaded it here -> {url}",
+                            mention_author=False)
+            return
+        await ctx.reply(codeblock(message.replace('```', '`\u200b``'), lang='yaml'), mention_author=False)
+
+    @commands.command(aliases=('execqueue',))
+    async def runqueue(self, ctx: Context) -> None:
+        """Shows how busy code execution is."""
+        stats = self.scheduler.stats
+        message = (
+            f"Running: {stats['active']}/{self.scheduler.limit}\n"
+            f"Queued: {stats['queued']}/{self.scheduler.max_queue}\n"
+            f"Average wait: {stats['mean_wait']:.2f}s (max {stats['max_wait']:.2f}s)\n"
+            f"Average run: {stats['mean_run']:.2f}s (max {stats['max_run']:.2f}s) over {stats['runs']} runs\n"
+            f"Rejected: {stats['rejected']}, timed out: {stats['timeouts']}"
+        )
+        await ctx.send(codeblock(message, lang='yaml'))
@@ -0,0 +1,154 @@
+"""Offline search over the search index rustdoc publishes for the standard library."""
+import heapq
+import json
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from extensions.code.index import SearchIndex, iter_bits
+
+DOCS_ROOT = "https://doc.rust-lang.org/"
+
+# rustdoc's itemTypes table, "t" holds indexes into it
+ITEM_TYPES = (
+    "mod", "externcrate", "import", "struct", "enum", "fn", "type", "static", "trait", "impl", "tymethod",
+    "method", "structfield", "variant", "macro", "primitive", "associatedtype", "constant", "associatedconstant",
+    "union", "foreigntype", "keyword", "existential", "attr", "derive", "traitalias", "generic"
+)
+# newer rustdoc versions moved keywords and primitives to the front of the table
+ITEM_TYPES_REORDERED = ("keyword", "primitive") + tuple(t for t in ITEM_TYPES if t not in ("keyword", "primitive"))
+
+JSON_PARSE = re.compile(r"JSON\.parse\('(.*)'\)", re.DOTALL)
+JS_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+LEGACY_CRATE = re.compile(r'searchIndex\["([^"]+)"\]\s*=\s*(\{.*?\});\s*$', re.MULTILINE)
+
+
+class RustItem:
+    __slots__ = ('crate', 'path', 'name', 'type', 'parent')
+
+    def __init__(self, crate: str, path: str, name: str, type_: str, parent: Optional[Tuple[str, str]]) -> None:
+        self.crate = crate
+        self.path = path
+        self.name = name
+        self.type = type_
+        self.parent = parent
+
+    @property
+    def display(self) -> str:
+        parts = [self.path] if self.path else []
+        if self.parent:
+            parts.append(self.parent[1])
+        parts.append(self.name)
+        return "::".join(parts)
+
+    @property
+    def url(self) -> str:
+        base = DOCS_ROOT + (self.path.replace("::", "/") + "/" if self.path else "")
+        if self.parent:
+            parent_type, parent_name = self.parent
+            return f"{base}{parent_type}.{parent_name}.html#{self.type}.{self.name}"
+        if self.type == "mod":
+            return f"{base}{self.name}/index.html"
+        return f"{base}{self.type}.{self.name}.html"
+
+
+def _load_corpora(text: str) -> Iterable[Tuple[str, dict]]:
+    match = JSON_PARSE.search(text)
+    if match is None:
+        # search-index.js from before rustdoc started wrapping it in JSON.parse
+        return [(crate, json.loads(body)) for crate, body in LEGACY_CRATE.findall(text)]
+
+    data = json.loads(JS_ESCAPE.sub(lambda m: m.group(1), match.group(1)))
+    return data.items() if isinstance(data, dict) else data
+
+
+def _type_table(corpus: dict) -> Tuple[str, ...]:
+    # the first item is always the crate's root module
+    first = corpus["t"][0]
+    code = first if isinstance(first, int) else ord(first) - 65
+    return ITEM_TYPES if code == ITEM_TYPES.index("mod") else ITEM_TYPES_REORDERED
+
+
+def parse_search_index(text: str) -> List[RustItem]:
+    """Returns every item of a rustdoc search-index.js file."""
+    items = []
+    for crate, corpus in _load_corpora(text):
+        types = corpus["t"]
+        if isinstance(types, str):
+            types = [ord(c) - 65 for c in types]
+        table = _type_table(corpus)
+        names = corpus["n"]
+
+        paths = corpus.get("q", [])
+        if paths and isinstance(paths[0], list):
+            # sparse [[index, path], ...], a path applies until the next one
+            sparse = dict(paths)
+            paths = []
+            current = ""
+            for i in range(len(names)):
+                current = sparse.get(i, current)
+                paths.append(current)
+
+        parents = corpus.get("i", [])
+        if not isinstance(parents, list):
+            parents = []
+        parent_table = [(table[p[0]], p[1]) for p in corpus.get("p", [])]
+
+        path = ""
+        for i, name in enumerate(names):
+            if i < len(paths) and paths[i]:
+                path = paths[i]
+            parent = parents[i] if i < len(parents) else 0
+            items.append(RustItem(crate, path, name, table[types[i]], parent_table[parent - 1] if parent else None))
+    return items
+
+
+class RustIndex:
+    """In-memory search over rustdoc items, ranked roughly like rustdoc's own search.
+
+    Exact name matches come first, then prefix matches, then substring matches,
+    then the remaining subsequence matches. Free items beat members, shorter names
+    beat longer ones and ``std`` beats the other crates.
+    """
+
+    def __init__(self, items: List[RustItem]) -> None:
+        self.items = items
+        by_name = {}
+        for i, item in enumerate(items):
+            by_name.setdefault(item.name.lower(), []).append(i)
+        self.names = SearchIndex(by_name)
+        self._by_name = [by_name[name] for name in self.names.names]
+
+    @classmethod
+    def from_text(cls, text: str) -> 'RustIndex':
+        return cls(parse_search_index(text))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def search(self, query: str, limit: int = 8) -> List[RustItem]:
+        *path, name = query.lower().replace(" ", "").split("::")
+        path = [part for part in path if part]
+        if not name:
+            return []
+        fuzzy = re.compile('.*?'.join(map(re.escape, name)))
+        ranked = []
+        for i in iter_bits(self.names.candidates(name)):
+            candidate = self.names.names[i]
+            if candidate == name:
+                level = 0
+            elif candidate.startswith(name):
+                level = 1
+            elif name in candidate:
+                level = 2
+            elif fuzzy.search(candidate):
+                level = 3
+            else:
+                continue
+            for index in self._by_name[i]:
+                item = self.items[index]
+                if path and not all(part in item.display.lower() for part in path):
+                    continue
+                ranked.append((level, item.parent is not None, len(candidate), item.crate != "std",
+                               item.display.count("::"), index))
+
+        return [self.items[rank[-1]] for rank in heapq.nsmallest(limit, ranked)]
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Timing:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class ExecutionScheduler:
+    """Global concurrency cap for code execution with fair queuing.
+
+    Requests over the cap wait in per-guild, per-user queues. Whenever a slot frees
+    up the guilds take turns, and so do the users inside a guild, so one busy guild
+    or one user can't starve everybody else. Once ``max_queue`` requests are waiting
+    new ones are rejected with QueueFull.
+    """
+
+    def __init__(self, limit: int = 4, max_queue: int = 50, timeout: float = 30) -> None:
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_time = Timing()
+        self.run_time = Timing()
+        self._queues = OrderedDict()  # guild: OrderedDict(user: deque of futures)
+
+    async def acquire(self, guild: Hashable, user: Hashable,
+                      on_queued: Optional[Callable[[int], Awaitable[Any]]] = None) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull()
+
+        future = asyncio.get_event_loop().create_future()
+        self._queues.setdefault(guild, OrderedDict()).setdefault(user, deque()).append(future)
+        self.waiting += 1
+        try:
+            if on_queued is not None:
+                await on_queued(self.waiting)
+            await future
+        except BaseException:
+            # cancelled, or on_queued failed
+            if future.done() and not future.cancelled():
+                # the slot was handed over just before that
+                self.release()
+            else:
+                future.cancel()
+                self._discard(guild, user, future)
+            raise
+
+    def _discard(self, guild: Hashable, user: Hashable, future: asyncio.Future) -> None:
+        users = self._queues.get(guild, {})
+        waiters = users.get(user)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self.waiting -= 1
+        if not waiters:
+            del users[user]
+        if not users:
+            del self._queues[guild]
+
+    def release(self) -> None:
+        self.active -= 1
+        while self.active < self.limit and self._queues:
+            guild, users = next(iter(self._queues.items()))
+            user, waiters = next(iter(users.items()))
+            future = waiters.popleft()
+            self.waiting -= 1
+            # rotate, the next slot goes to the next user and guild in line
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if users:
+                self._queues.move_to_end(guild)
+            else:
+                del self._queues[guild]
+
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, guild: Hashable, user: Hashable,
+                   on_queued: Optional[Callable[[int], Awaitable[Any]]] = None):
+        start = time.perf_counter()
+        await self.acquire(guild, user, on_queued)
+        self.wait_time.add(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, guild: Hashable, user: Hashable, func: Callable[..., Awaitable], *args,
+                  on_queued: Optional[Callable[[int], Awaitable[Any]]] = None) -> Any:
+        """Awaits func(*args) inside a slot, giving up (and freeing the slot) after ``timeout`` seconds."""
+        async with self.slot(guild, user, on_queued):
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(func(*args), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            finally:
+                self.run_time.add(time.perf_counter() - start)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'queued': self.waiting,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'mean_wait': self.wait_time.mean,
+            'max_wait': self.wait_time.max,
+            'mean_run': self.run_time.mean,
+            'max_run': self.run_time.max,
+            'runs': self.run_time.count
+        }
@@ -0,0 +1,105 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import quote
+
+from extensions.code.index import Inventory, PackedStrings
+
+# magic, then the lengths of: JSON header, offset table, names, locations
+MAGIC = b'CAINV\x01'
+LAYOUT = struct.Struct('<6sIIII')
+
+
+@dataclass
+class StoredInventory:
+    entries: Inventory
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def _offsets_to_bytes(offsets: array) -> bytes:
+    if sys.byteorder == 'big':
+        offsets = array('I', offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def _offsets_from_bytes(data) -> array:
+    offsets = array('I')
+    offsets.frombytes(data)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
+
+class InventoryStore:
+    """Parsed Sphinx inventories saved to disk so they survive restarts.
+
+    Each file holds a small JSON header (source URL and validators) followed by an
+    Inventory's packed tables as they are laid out in memory. Files are read through
+    mmap, so a load is a couple of copies and decodes rather than a parse.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file_for(self, key: str) -> str:
+        return os.path.join(self.path, quote(key, safe='') + '.inv')
+
+    def save(self, key: str, inventory: Inventory, *,
+             etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        names, locations = inventory.names, inventory.locations
+        header = json.dumps({'url': inventory.url, 'etag': etag, 'last_modified': last_modified}).encode('utf-8')
+        sections = (
+            header,
+            _offsets_to_bytes(names.offsets) + _offsets_to_bytes(locations.offsets),
+            names.data.encode('utf-8'),
+            locations.data.encode('utf-8')
+        )
+
+        path = self.file_for(key)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(LAYOUT.pack(MAGIC, *map(len, sections)))
+            for section in sections:
+                f.write(section)
+        os.replace(path + '.tmp', path)
+
+    def load(self, key: str, url: str) -> Optional[StoredInventory]:
+        """Returns the saved copy of ``key``, or None if it is missing, corrupt or for another URL."""
+        try:
+            with open(self.file_for(key), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, *lengths = LAYOUT.unpack_from(mm)
+                # a truncated or padded file would otherwise load with some tables cut short
+                if magic != MAGIC or len(mm) != LAYOUT.size + sum(lengths):
+                    return None
+                pos = LAYOUT.size
+                sections = []
+                for length in lengths:
+                    sections.append(mm[pos:pos + length])
+                    pos += length
+
+            header, offsets, names_data, locations_data = sections
+            header = json.loads(header)
+            if header['url'] != url:
+                return None
+
+            # two offset tables of the same length, each one ending at its string's length
+            if len(offsets) % 8:
+                return None
+            offsets = _offsets_from_bytes(offsets)
+            split = len(offsets) // 2
+            names_data, locations_data = names_data.decode('utf-8'), locations_data.decode('utf-8')
+            if not split or offsets[split - 1] != len(names_data) or offsets[-1] != len(locations_data):
+                return None
+            names = PackedStrings.from_buffers(names_data, offsets[:split])
+            locations = PackedStrings.from_buffers(locations_data, offsets[split:])
+            inventory = Inventory.from_tables(url, names, locations)
+            return StoredInventory(inventory, header['etag'], header['last_modified'])
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            return None
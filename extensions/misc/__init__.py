@@ -1,6 +1,10 @@
-from core import Bot
+import psutil
+from core import Bot, Context
+from core import metrics
 from discord.ext import commands
 
+from ..utils import codeblock
+
 
 class BotInfo(commands.Cog):
     """Information regarding the bot."""
@@ -11,6 +15,79 @@ class BotInfo(commands.Cog):
     async def info(self, ctx):
         await ctx.send("Hi i am little bot and I am made by ppotatoo#9688 erm yea")
 
+    @commands.command()
+    @commands.is_owner()
+    async def lag(self, ctx: Context):
+        """Shows how long the event loop has been blocked, and by what."""
+        monitor = self.bot.lag_monitor
+        stats = monitor.stats
+        lines = [
+            f"Stalls over {monitor.threshold * 1000:.0f}ms: {stats['stalls']}",
+            f"Worst stall: {stats['max_lag'] * 1000:.0f}ms",
+            f"Total time blocked: {stats['total_lag']:.2f}s",
+            ""
+        ]
+        lines.extend(f"{seconds:6.2f}s  {site}" for site, seconds in monitor.worst())
+        await ctx.send(codeblock("\n".join(lines), lang='yaml'))
+
+    @commands.command()
+    @commands.is_owner()
+    async def metrics(self, ctx: Context):
+        """Shows command latencies, upstream timings and cache hit ratios."""
+        lines = ["Commands (count, mean, p95):"]
+        histogram = metrics.commands_seconds
+        for labels in sorted(histogram.counts, key=lambda key: -sum(histogram.counts[key]))[:15]:
+            labels = dict(labels)
+            failed = " (failed)" if labels['failed'] == 'True' else ""
+            lines.append(f"  {labels['command']}{failed}: {histogram.count(**labels)}, "
+                         f"{histogram.mean(**labels) * 1000:.0f}ms, {histogram.quantile(0.95, **labels) * 1000:.0f}ms")
+
+        lines.append("Upstreams (count, mean, p95):")
+        histogram = metrics.upstream_seconds
+        for labels in sorted(histogram.counts, key=lambda key: -sum(histogram.counts[key])):
+            labels = dict(labels)
+            lines.append(f"  {labels['method']} {labels['host']} {labels['status']}: {histogram.count(**labels)}, "
+                         f"{histogram.mean(**labels) * 1000:.0f}ms, {histogram.quantile(0.95, **labels) * 1000:.0f}ms")
+        for labels, count in metrics.upstream_errors.values.items():
+            labels = dict(labels)
+            lines.append(f"  {labels['method']} {labels['host']} {labels['error']}: {count:.0f}")
+
+        lines.append("Caches (hits/lookups):")
+        caches = {}
+        for labels, count in metrics.cache_lookups.values.items():
+            labels = dict(labels)
+            caches.setdefault(labels['cache'], {})[labels['result']] = count
+        for name, counts in sorted(caches.items()):
+            lookups = counts.get('hit', 0) + counts.get('miss', 0)
+            lines.append(f"  {name}: {counts.get('hit', 0):.0f}/{lookups:.0f} ({counts.get('hit', 0) / lookups:.0%})")
+
+        text = "\n".join(lines)
+        if len(text) > 1900:
+            return await ctx.send(await ctx.mystbin(text))
+        await ctx.send(codeblock(text, lang='yaml'))
+
+    @commands.command()
+    @commands.is_owner()
+    async def http(self, ctx: Context):
+        """Shows requests, errors, retries and latency per upstream host."""
+        lines = []
+        for host, stats in sorted(self.bot.http_client.stats.items(), key=lambda item: -item[1]['requests']):
+            lines.append(f"{host}: {stats['requests']} requests, {stats['errors']} errors, {stats['retries']} retries, "
+                         f"{stats['coalesced']} coalesced, {stats['mean'] * 1000:.0f}ms mean, "
+                         f"{stats['max'] * 1000:.0f}ms max")
+        await ctx.send(codeblock("\n".join(lines) or "No requests yet.", lang='yaml'))
+
+    @commands.command()
+    @commands.is_owner()
+    async def startup(self, ctx: Context):
+        """Shows where startup time went and which extensions are still waiting to be loaded."""
+        lines = [f"{seconds:7.3f}s  {phase}" for phase, seconds in self.bot.startup_times.items()]
+        pending = sorted(self.bot.pending_extensions)
+        lines.append("")
+        lines.append(f"Not loaded yet: {', '.join(pending) or 'nothing'}")
+        lines.append(f"RSS: {psutil.Process().memory_info().rss / 2 ** 20:.1f} MiB")
+        await ctx.send(codeblock("\n".join(lines), lang='yaml'))
+
 
 def setup(bot):
-    bot.add_cog(BotInfo())
+    bot.add_cog(BotInfo(bot))
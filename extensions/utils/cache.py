@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from core.metrics import cache_lookups
+
+
+def normalize(query: str) -> str:
+    return ' '.join(query.split()).lower()
+
+
+class TTLCache:
+    """Size bounded LRU cache whose entries expire after a TTL.
+
+    Empty values ("no results") are kept for ``negative_ttl`` instead of ``ttl``.
+    With a ``path`` the cache is reloaded from a JSON file on creation, and changes
+    are written back to it in batches by flush() (or pending() and write(), to write
+    off the event loop), which requires string keys and JSON serializable values.
+    Lookups on a cache with a ``name`` are also counted in the bot's metrics.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600, negative_ttl: float = 300,
+                 path: Optional[str] = None, name: Optional[str] = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()  # key: (expires at, value)
+        self._dirty = False
+        if path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > time.time()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None or item[0] <= time.time():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            self._record('miss')
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        self._record('hit')
+        return item[1]
+
+    def _record(self, result: str) -> None:
+        if self.name is not None:
+            cache_lookups.inc(cache=self.name, result=result)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl if value else self.negative_ttl
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        self._dirty = True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        self._dirty = True
+        return item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._dirty = True
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires, value in items[-self.maxsize:]:
+            if expires > now:
+                self._data[key] = (expires, value)
+
+    def pending(self) -> Optional[list]:
+        """A snapshot of the entries to write() if anything changed since the last one, otherwise None."""
+        if self.path is None or not self._dirty:
+            return None
+        self._dirty = False
+        return [[key, expires, value] for key, (expires, value) in self._data.items()]
+
+    def write(self, items: list) -> None:
+        """Writes a snapshot from pending(), safe to call from another thread."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(items, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def flush(self) -> None:
+        if (items := self.pending()) is not None:
+            self.write(items)